@@ -1,5 +1,6 @@
 import fs from 'fs'
 import path from 'path'
+import readline from 'readline'
 
 import { DOMParser } from 'xmldom'
 import * as xpath from 'xpath-ts'
@@ -212,14 +213,44 @@ function copyRepoSettings(bookPath: string, settingsDir: string) {
   recCopyDir(settingsDir, bookPath)
 }
 
-function prepareBookRepo(bookPath: string, staticResourceDir: string) {
+function prepareBookRepo(bookPath: string, staticResourceDir: string): BookMeta {
   const meta = getBookMeta(bookPath)
   writeReadme(meta, bookPath, staticResourceDir)
   copyRepoSettings(bookPath, path.join(staticResourceDir, 'repo-settings'))
-  
-  // This is a temporary addition so that the python script can handle the
+  return meta
+}
+
+// One line of JSON per book, so a batch keeps going when one book fails
+function prepareBookLine(bookPath: string, staticResourceDir: string): string {
+  try {
+    const meta = prepareBookRepo(bookPath, staticResourceDir)
+    return JSON.stringify({ path: bookPath, meta })
+  } catch (e) {
+    const error = e instanceof Error ? e.message : String(e)
+    return JSON.stringify({ path: bookPath, error })
+  }
+}
+
+function main(args: string[]) {
+  const staticResourceDir = path.join(__dirname, 'static')
+  // The book metadata is printed so that the python script can handle the
   // license related work that is out of the scope of this script
-  console.log(JSON.stringify(meta))
+  if (args[0] === '--stdin') {
+    // Long lived worker: one book path per line in, one line of JSON out
+    const lines = readline.createInterface({ input: process.stdin, terminal: false })
+    lines.on('line', line => {
+      const bookPath = line.trim()
+      if (bookPath.length > 0) {
+        process.stdout.write(prepareBookLine(bookPath, staticResourceDir) + '\n')
+      }
+    })
+  } else if (args.length > 1) {
+    for (const bookPath of args) {
+      console.log(prepareBookLine(bookPath, staticResourceDir))
+    }
+  } else {
+    console.log(JSON.stringify(prepareBookRepo(args[0], staticResourceDir)))
+  }
 }
 
-prepareBookRepo(process.argv[2], path.join(__dirname, 'static'))
+main(process.argv.slice(2))
@@ -1,50 +1,199 @@
+import argparse
+import base64
+import csv
 import functools
+import hashlib
 import json
 import logging
+import multiprocessing
 import os
+import queue
 import re
 import shutil
 import sys
+import threading
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from shlex import split
-from subprocess import PIPE, run
-from typing import Any, Dict, List, Optional
+from subprocess import PIPE, CompletedProcess, Popen, run
+from typing import IO, Any, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+from urllib.request import urlopen
 
 SCRIPT_ROOT = Path(__file__).parent
 REPO_PREP_SCRIPT = SCRIPT_ROOT/'index.ts'
+DELETE_CHUNK_SIZE = 100
+RUN_STATE_FILE = SCRIPT_ROOT/'run-state.json'
+
+
+CLONE_MODES = ('full', 'shallow', 'blobless')
+
+
+class CloneStrategy:
+    """How repositories are cloned
+
+    With a mirror root every repository is first fetched into a bare mirror
+    under it, and clones borrow the mirror's objects (`--reference`), so only
+    what changed since the last run is downloaded. `shallow` clones only the
+    tip of each branch and `blobless` leaves file contents to be fetched when
+    they are checked out.
+    """
+
+    def __init__(self, mode: str = 'full',
+                 remote_root: str = 'https://github.com',
+                 mirror_root: Optional[Path] = SCRIPT_ROOT/'mirrors'):
+        if mode not in CLONE_MODES:
+            raise ValueError(f'Unknown clone mode: {mode}')
+        self.mode = mode
+        self.remote_root = remote_root.rstrip('/')
+        self.mirror_root = mirror_root
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> 'CloneStrategy':
+        mirror_root = os.environ.get('GIT_MIRROR_ROOT', str(SCRIPT_ROOT/'mirrors'))
+        options = {
+            'mode': os.environ.get('CLONE_MODE', 'full'),
+            'remote_root': os.environ.get('GIT_REMOTE_ROOT', 'https://github.com'),
+            'mirror_root': Path(mirror_root) if mirror_root else None,
+        }
+        options.update(kwargs)
+        return cls(**options)
+
+    def url(self, remote_repo: str) -> str:
+        return f'{self.remote_root}/{remote_repo}.git'
+
+    def _lock(self, remote_repo: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(remote_repo, threading.Lock())
+
+    def update_mirror(self, remote_repo: str) -> Tuple[Path, int]:
+        """Creates or fetches into the mirror of a repository
+
+        Returns the mirror and how many git processes were run.
+        """
+        assert self.mirror_root is not None
+        mirror = (self.mirror_root/f'{remote_repo}.git').absolute()
+        spawned = 0
+        with self._lock(remote_repo):
+            if not (mirror/'HEAD').exists():
+                mirror.mkdir(parents=True, exist_ok=True)
+                sspawn(f'git init --bare -q "{mirror}"')
+                # Clones borrow objects from the mirror, so they must never
+                # be pruned there, even once their branch is deleted
+                sspawn(f'git -C "{mirror}" config gc.auto 0')
+                sspawn(f'git -C "{mirror}" config gc.pruneExpire never')
+                spawned += 3
+            sspawn(f'git -C "{mirror}" fetch --prune --tags -q '
+                   f'"{self.url(remote_repo)}" "+refs/heads/*:refs/heads/*"')
+            spawned += 1
+        return mirror, spawned
+
+    def clone(self, remote_repo: str, path: Path) -> int:
+        """Clones a repository into path, returns how many git processes ran"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        flags = []
+        spawned = 1
+        if self.mirror_root is not None:
+            mirror, mirror_spawned = self.update_mirror(remote_repo)
+            flags.append(f'--reference "{mirror}"')
+            spawned += mirror_spawned
+        if self.mode == 'shallow':
+            # Every branch, so the stale ones can still be cleaned up
+            flags.append('--depth 1 --no-single-branch')
+        elif self.mode == 'blobless':
+            flags.append('--filter=blob:none')
+        sspawn(f'git clone {" ".join(flags)} '
+               f'"{self.url(remote_repo)}" "{path}"')
+        return spawned
+
+
+# git commands that do not change refs, so they keep the ref snapshot valid
+READ_ONLY_COMMANDS = frozenset([
+    'diff', 'for-each-ref', 'log', 'ls-remote', 'rev-parse', 'show', 'status',
+])
 
 
 class GitRepo:
     def __init__(self, path: str = ".", working_branch: str = 'main',
-                 remote_repo: Optional[str] = None, create: bool = False):
+                 remote_repo: Optional[str] = None, create: bool = False,
+                 clone_strategy: Optional[CloneStrategy] = None):
         self.path = path
         self.working_branch = working_branch
         self.remote_repo = remote_repo
+        self.clone_strategy = clone_strategy or CloneStrategy.from_env()
+        self.spawn_count = 0
+        self._refs: Optional[Dict[str, Any]] = None
         self._init(create)
 
     def __call__(self, command: str) -> str:
-        return sspawn(
-            f'git -C "{self.path}" {command}').decode('utf-8').strip()
+        git_command = split(f'git -C "{self.path}" {command}')
+        return check_process(git_command, self.run(command)) \
+            .decode('utf-8').strip()
+
+    def run(self, command: str) -> CompletedProcess:
+        """Runs a git command without raising when it fails"""
+        self.spawn_count += 1
+        try:
+            return create_process(split(f'git -C "{self.path}" {command}'))
+        finally:
+            if split(command)[0] not in READ_ONLY_COMMANDS:
+                self.invalidate()
+
+    def invalidate(self):
+        self._refs = None
+
+    @property
+    def refs(self) -> Dict[str, Any]:
+        """Every local branch, remote branch and tag from one for-each-ref
+
+        The snapshot is kept until a git command that can change refs runs.
+        """
+        if self._refs is None:
+            refs: Dict[str, Any] = {
+                'head': None, 'heads': [], 'remotes': [], 'tags': []}
+            output = self('for-each-ref --format="%(refname) %(HEAD)"')
+            for line in filter(len, output.split('\n')):
+                refname, _, current = line.partition(' ')
+                if refname.startswith('refs/heads/'):
+                    name = refname[len('refs/heads/'):]
+                    refs['heads'].append(name)
+                    if current == '*':
+                        refs['head'] = name
+                elif refname.startswith('refs/remotes/'):
+                    refs['remotes'].append(refname[len('refs/remotes/'):])
+                elif refname.startswith('refs/tags/'):
+                    refs['tags'].append(refname[len('refs/tags/'):])
+            self._refs = refs
+        return self._refs
 
     @property
     def branch(self) -> str:
-        return self('branch --show-current')
+        head = self.refs['head']
+        if head is None:
+            # Detached, or a branch without commits yet
+            head = self('branch --show-current')
+        return head
 
     @property
     def branches_local(self) -> List[str]:
-        return [br.lstrip('*').strip() for br in self('branch -l').split('\n')]
+        return list(self.refs['heads'])
 
     @property
     def branches_remote(self) -> List[str]:
-        return list(
-            filter(len, map(str.strip, self('branch -rl').split('\n'))))
+        return list(self.refs['remotes'])
 
     @property
     def tags(self) -> List[str]:
-        return list(filter(len, map(str.strip, self('tag -l').split('\n'))))
+        return list(self.refs['tags'])
 
     @property
     def has_changes(self) -> bool:
+        # Not cached: orphan removal, ts-node and the license check change
+        # the working tree without going through git
         return self('status -s') != ''
 
     def checkout(self, branch: str, create: bool = False):
@@ -64,10 +213,9 @@ class GitRepo:
             self(f'push origin "{self.working_branch}"')
 
     def clone_repo(self):
-        parent_path = Path(self.path).parent
-        parent_path.mkdir(parents=True, exist_ok=True)
-        git_url = f'https://github.com/{self.remote_repo}.git'
-        sspawn(f'git -C {parent_path} clone {git_url}')
+        assert self.remote_repo is not None
+        self.spawn_count += self.clone_strategy.clone(
+            self.remote_repo, Path(self.path))
 
     @staticmethod
     def configure_secrets():
@@ -107,13 +255,42 @@ class GitRepo:
             self(f'pull --rebase origin "{branch}"')
 
 
+_log_buffer = threading.local()
+_log_lock = threading.Lock()
+
+
+def buffer_log_record(record: logging.LogRecord) -> bool:
+    records = getattr(_log_buffer, 'records', None)
+    if records is None:
+        return True
+    records.append(record)
+    return False
+
+
+@contextmanager
+def buffered_log():
+    """Holds back everything logged by this thread until the block ends
+
+    The records are then logged together, so the output of books processed
+    at the same time does not interleave.
+    """
+    _log_buffer.records = []
+    try:
+        yield
+    finally:
+        records = _log_buffer.records
+        _log_buffer.records = None
+        with _log_lock:
+            for record in records:
+                logging.getLogger().handle(record)
+
+
 def create_process(command: List[str]):
     logging.info(' '.join(command))
     return run(command, stdout=PIPE, stderr=PIPE)
 
 
-def spawn(command: List[str]) -> bytes:
-    p = create_process(command)
+def check_process(command: List[str], p: CompletedProcess) -> bytes:
     if p.returncode != 0:
         if p.stderr:
             err = f'{command}: {p.stderr.decode("utf-8")}'
@@ -123,25 +300,101 @@ def spawn(command: List[str]) -> bytes:
     return p.stdout
 
 
+def spawn(command: List[str]) -> bytes:
+    return check_process(command, create_process(command))
+
+
 def sspawn(command: str) -> bytes:
     return spawn(split(command))
 
 
-def get_approved_books() -> List[str]:
+def get_approved_book_entries(save: bool = True) -> List[Dict[str, Any]]:
     abl_path = SCRIPT_ROOT/'approved-book-list.json'
-    if not abl_path.exists():
+    if abl_path.exists():
+        abl = json.loads(abl_path.read_bytes())
+    elif save:
         sspawn(f'wget {os.environ["ABL_URL"]} -O {abl_path}')
-    abl = json.loads(abl_path.read_bytes())
+        abl = json.loads(abl_path.read_bytes())
+    else:
+        with urlopen(os.environ['ABL_URL']) as response:
+            abl = json.loads(response.read())
+    return abl['approved_books']
+
+
+def get_approved_books(save: bool = True) -> List[str]:
     return [
         book['repository_name']
-        for book in abl['approved_books']
+        for book in get_approved_book_entries(save)
     ]
 
 
-def get_branches_to_delete(git: GitRepo):
+def hash_json(value: Any) -> str:
+    return hashlib.sha256(
+        json.dumps(value, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+@functools.lru_cache
+def hash_paths(*paths: Path) -> str:
+    """Hash of the names and contents of every file in paths"""
+    digest = hashlib.sha256()
+    for path in paths:
+        files = sorted(p for p in path.rglob('*') if p.is_file()) \
+            if path.is_dir() else [path]
+        for file in files:
+            digest.update(str(file.relative_to(SCRIPT_ROOT)).encode('utf-8'))
+            digest.update(b'\0')
+            digest.update(file.read_bytes())
+    return digest.hexdigest()
+
+
+def get_remote_refs_hash(clone_strategy: CloneStrategy, repo: str) -> str:
+    # Every branch and tag, so deleting stale refs counts as a change too
+    # (not refs/pull/*, which GitHub changes without the book moving)
+    refs = sspawn(f'git ls-remote --heads --tags "{clone_strategy.url(repo)}"')
+    return hashlib.sha256(refs).hexdigest()
+
+
+def get_book_fingerprint(
+    clone_strategy: CloneStrategy,
+    repo: str,
+    abl_entry: Dict[str, Any]
+) -> Dict[str, str]:
+    """What a book's sync depends on, the same until one of them changes"""
+    return {
+        'remote_refs': get_remote_refs_hash(clone_strategy, repo),
+        'abl_entry': hash_json(abl_entry),
+        'licenses': hash_paths(SCRIPT_ROOT/'licenses'),
+        'repo_prep': hash_paths(REPO_PREP_SCRIPT, SCRIPT_ROOT/'static'),
+    }
+
+
+class RunState:
+    """The fingerprint of every book as of its last successful sync"""
+
+    def __init__(self, path: Path = RUN_STATE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state: Dict[str, Dict[str, str]] = {}
+        if path.exists():
+            self._state = json.loads(path.read_text())
+
+    def is_current(self, repo: str, fingerprint: Dict[str, str]) -> bool:
+        with self._lock:
+            return self._state.get(repo) == fingerprint
+
+    def record(self, repo: str, fingerprint: Dict[str, str]):
+        with self._lock:
+            self._state[repo] = fingerprint
+            tmp_path = self.path.with_name(f'{self.path.name}.tmp')
+            tmp_path.write_text(json.dumps(self._state, indent=2,
+                                           sort_keys=True))
+            os.replace(tmp_path, self.path)
+
+
+def filter_branches_to_delete(branches_remote: List[str]) -> List[str]:
     remote_branches = [
         bs.strip()
-        for bs in git.branches_remote
+        for bs in branches_remote
         # filter out HEAD branch and 1e, 2e, etc.
         if 'HEAD' not in bs and re.match(r'\s*origin/[0-9]+e', bs) is None]
     # remove instead of filter: this ensures it exists
@@ -149,41 +402,252 @@ def get_branches_to_delete(git: GitRepo):
     return remote_branches
 
 
-def cleanup_branches(git: GitRepo):
+def get_branches_to_delete(git: GitRepo):
+    return filter_branches_to_delete(git.branches_remote)
+
+
+def push_deletes(
+    git: GitRepo,
+    remote: str,
+    refs: List[str],
+    atomic: bool = True
+) -> Dict[str, Optional[str]]:
+    """Deletes refs from the remote with one push
+
+    Returns every ref git reported on, mapped to None when it was deleted or
+    to the reason it was rejected.
+    """
+    refspecs = ' '.join(f'":{ref}"' for ref in refs)
+    flags = '--atomic --porcelain' if atomic else '--porcelain'
+    command = f'push {flags} "{remote}" {refspecs}'
+    p = git.run(command)
+
+    statuses: Dict[str, Optional[str]] = {}
+    # <flag>\t:<ref>\t<summary> (<reason>), see git help push
+    for line in p.stdout.decode('utf-8').split('\n'):
+        fields = line.split('\t')
+        if len(fields) != 3 or not fields[1].startswith(':'):
+            continue
+        flag, ref, summary = fields[0], fields[1][1:], fields[2]
+        statuses[ref] = None if flag == '-' else summary
+    if not statuses:
+        # Nothing was pushed at all, e.g. the remote could not be reached
+        check_process(split(f'git {command}'), p)
+    return statuses
+
+
+def get_remote_ref_names(git: GitRepo, remote: str) -> Set[str]:
+    """The branches and tags on the remote, as full ref names"""
+    output = git(f'ls-remote --heads --tags "{remote}"')
+    return {
+        line.split('\t')[1]
+        for line in output.split('\n')
+        if '\t' in line and not line.endswith('^{}')}
+
+
+def delete_remote_refs(
+    git: GitRepo,
+    refs: List[str],
+    remote: str = 'origin',
+    chunk_size: int = DELETE_CHUNK_SIZE
+) -> List[str]:
+    """Deletes refs from the remote, many refs per push
+
+    Each chunk of refs is deleted with one atomic push. When any ref in the
+    chunk is rejected the whole push fails (a pre-receive hook rejects every
+    ref with the same reason), so every ref of the chunk that was not
+    deleted is tried again on its own. Refs that are not on the remote are
+    skipped. Returns the refs that were deleted.
+    """
+    existing = get_remote_ref_names(git, remote)
+    missing = [ref for ref in refs if ref not in existing]
+    if missing:
+        logging.info(f'Not on {remote}, skipping: {missing}')
+    refs = [ref for ref in refs if ref in existing]
+
+    deleted = []
+    for start in range(0, len(refs), max(1, chunk_size)):
+        chunk = refs[start:start + max(1, chunk_size)]
+        statuses = push_deletes(git, remote, chunk)
+        retry = []
+        for ref in chunk:
+            if statuses.get(ref, 'not reported by git push') is None:
+                deleted.append(ref)
+            else:
+                retry.append(ref)
+        for ref in retry:
+            reason = push_deletes(git, remote, [ref], atomic=False) \
+                .get(ref, 'not reported by git push')
+            if reason is None:
+                deleted.append(ref)
+            else:
+                logging.warning(f'Could not delete {remote} {ref}: {reason}')
+    return deleted
+
+
+def is_cleaned_up(
+    git: GitRepo,
+    remote: str,
+    refs: List[str],
+    deleted: List[str]
+) -> bool:
+    """Whether none of refs is left on the remote"""
+    remaining = set(refs).difference(deleted)
+    # Refs that were not deleted may never have been on the remote
+    return not remaining or not remaining & get_remote_ref_names(git, remote)
+
+
+def cleanup_branches(
+    git: GitRepo,
+    chunk_size: int = DELETE_CHUNK_SIZE
+) -> bool:
+    """Deletes the stale branches, returns whether all of them are gone"""
+    branches_by_remote: Dict[str, List[str]] = {}
     for branch_spec in get_branches_to_delete(git):
         remote, branch = branch_spec.split('/', maxsplit=1)
-        git(f'push "{remote}" --delete "{branch}"')
+        branches_by_remote.setdefault(remote, []).append(f'refs/heads/{branch}')
+    cleaned_up = True
+    for remote, refs in branches_by_remote.items():
+        deleted = delete_remote_refs(git, refs, remote, chunk_size)
+        logging.info(f'Removed {len(deleted)} of {len(refs)} branch(es) '
+                     f'from {remote}: {deleted}')
+        cleaned_up &= is_cleaned_up(git, remote, refs, deleted)
+    return cleaned_up
 
 
 def get_tags_to_delete(git: GitRepo):
     return git.tags
 
 
-def cleanup_tags(git: GitRepo):
-    for tag in get_tags_to_delete(git):
-        git(f'push origin --delete "{tag}"')
+def cleanup_tags(git: GitRepo, chunk_size: int = DELETE_CHUNK_SIZE) -> bool:
+    """Deletes every tag, returns whether all of them are gone"""
+    refs = [f'refs/tags/{tag}' for tag in get_tags_to_delete(git)]
+    deleted = delete_remote_refs(git, refs, 'origin', chunk_size)
+    logging.info(f'Removed {len(deleted)} of {len(refs)} tag(s) '
+                 f'from origin: {deleted}')
+    return is_cleaned_up(git, 'origin', refs, deleted)
 
 
-def remove_orphans(book_path: Path, directory_whitelist: List[Path]):
-    p = create_process(split(f'poet orphans {book_path}'))
+# Files every book keeps even though nothing references them
+ORPHAN_IGNORE = frozenset(['README.md', 'LICENSE'])
+# Books with more modules than this have their modules parsed across cores
+PARALLEL_MODULE_COUNT = 200
 
-    # https://github.com/openstax/poet/blob/c3c6c37d43d60f4501aead37c43cbbb3faa24704/server/src/model/_cli.ts#L189
-    if p.returncode != 111:
-        return
 
-    poet_errors = p.stderr.decode('utf-8').strip().split('\n')
-    poet_output = p.stdout.decode('utf-8').strip().split('\n')
+def iter_references(xml_path: str) -> Iterable[Tuple[str, str]]:
+    """Every (attribute, value) that can point at another file of the book
 
-    for line in poet_errors:
-        if 'Validation Errors' in line:
-            error_count = int(line.split(':')[1].strip())
-            raise Exception('Validation Errors:\n' +
-                            '\n'.join(poet_output[:error_count]))
+    The file is parsed as a stream and each element is dropped once read.
+    """
+    for _, element in ET.iterparse(xml_path):
+        for attribute in ('href', 'src', 'resource', 'document'):
+            value = element.get(attribute)
+            if value:
+                yield attribute, value
+        element.clear()
 
-    orphans = filter(Path.exists, map(Path, poet_output))
 
+def is_local_reference(value: str) -> bool:
+    return not (value.startswith('#') or urlparse(value).scheme)
+
+
+def module_path(book_path: Path, module_id: str) -> str:
+    return os.path.normpath(book_path/'modules'/module_id/'index.cnxml')
+
+
+def get_module_references(path: str) -> Tuple[List[str], List[str]]:
+    """The files and the module ids referenced by a module"""
+    files, module_ids = [], []
+    for attribute, value in iter_references(path):
+        if attribute == 'document':
+            module_ids.append(value)
+        elif attribute in ('src', 'resource') and is_local_reference(value):
+            files.append(os.path.normpath(
+                os.path.join(os.path.dirname(path), value.split('#')[0])))
+    return files, module_ids
+
+
+def find_referenced_files(
+    book_path: Path,
+    executor: Optional[ProcessPoolExecutor] = None
+) -> Set[str]:
+    """Every file reachable from META-INF/books.xml
+
+    books.xml references collections, collections reference modules and
+    modules reference media and other modules. The modules of big books are
+    parsed in `executor` when one is given.
+    """
+    books_xml = os.path.normpath(book_path/'META-INF'/'books.xml')
+    referenced = {books_xml}
+    missing = []
+
+    collections = [
+        os.path.normpath(os.path.join(os.path.dirname(books_xml), value))
+        for attribute, value in iter_references(books_xml)
+        if attribute == 'href']
+    modules = []
+    for collection in collections:
+        if not os.path.exists(collection):
+            missing.append(collection)
+            continue
+        referenced.add(collection)
+        modules.extend(
+            module_path(book_path, value)
+            for attribute, value in iter_references(collection)
+            if attribute == 'document')
+
+    if len(modules) <= PARALLEL_MODULE_COUNT:
+        executor = None
+    while modules:
+        modules = [m for m in dict.fromkeys(modules) if m not in referenced]
+        found = [m for m in modules if os.path.exists(m)]
+        missing.extend(set(modules).difference(found))
+        referenced.update(found)
+        if executor is not None:
+            results = executor.map(get_module_references, found, chunksize=16)
+        else:
+            results = map(get_module_references, found)
+        modules = []
+        for files, module_ids in results:
+            referenced.update(files)
+            missing.extend(f for f in files if not os.path.exists(f))
+            modules.extend(module_path(book_path, m) for m in module_ids)
+
+    if missing:
+        raise Exception('Validation Errors:\n' + '\n'.join(
+            f'Missing file: {path}' for path in sorted(set(missing))))
+    return referenced
+
+
+def find_orphans(
+    book_path: Path,
+    executor: Optional[ProcessPoolExecutor] = None
+) -> List[Path]:
+    """Files of the book that nothing references, like `poet orphans`
+
+    Dotfiles, README.md and LICENSE are never orphans.
+    """
+    referenced = find_referenced_files(book_path, executor)
+    orphans = []
+    for root, dirs, files in os.walk(book_path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            path = Path(root)/name
+            if name.startswith('.') or (
+                    Path(root) == book_path and name in ORPHAN_IGNORE):
+                continue
+            if os.path.normpath(path) not in referenced:
+                orphans.append(path)
+    return orphans
+
+
+def remove_orphans(
+    book_path: Path,
+    directory_whitelist: List[Path],
+    executor: Optional[ProcessPoolExecutor] = None
+):
     total = 0
-    for orphan in orphans:
+    for orphan in find_orphans(book_path, executor):
         if (not orphan.is_file() or orphan.parent not in directory_whitelist):
             continue
         if orphan.name == 'index.cnxml':
@@ -196,8 +660,12 @@ def remove_orphans(book_path: Path, directory_whitelist: List[Path]):
     logging.info(f'Removed {total} orphan(s)')
 
 
-def cleanup_files(git: GitRepo, book_path: Path):
-    remove_orphans(book_path, [book_path])
+def cleanup_files(
+    git: GitRepo,
+    book_path: Path,
+    executor: Optional[ProcessPoolExecutor] = None
+):
+    remove_orphans(book_path, [book_path], executor)
     git.commit_all('Remove unnecessary files from root directory')
 
 
@@ -237,8 +705,109 @@ def ensure_correct_license(
         git.commit_all('Update LICENSE')
 
 
-def run_repo_prep(git: GitRepo, book_path: Path):
-    book_meta = json.loads(sspawn(f'ts-node {REPO_PREP_SCRIPT} {book_path}'))
+def queue_lines(stream: IO[str], lines: 'queue.Queue[str]'):
+    for line in stream:
+        lines.put(line)
+    # End of the stream
+    lines.put('')
+
+
+class RepoPrepWorker:
+    """A long lived `ts-node index.ts --stdin` shared by every thread
+
+    TypeScript is compiled once when the worker starts instead of once per
+    book. Books are sent one at a time; a worker that dies or takes longer
+    than `timeout` seconds on a book is stopped and started again for the
+    next one. What the worker writes to stderr is logged by the thread of
+    the book it was preparing.
+    """
+
+    def __init__(self, command: Optional[List[str]] = None,
+                 timeout: float = 120):
+        self.command = command or ['ts-node', str(REPO_PREP_SCRIPT), '--stdin']
+        self.timeout = timeout
+        self._process: Optional[Popen] = None
+        self._lines: 'queue.Queue[str]' = queue.Queue()
+        self._errors: 'queue.Queue[str]' = queue.Queue()
+        self._lock = threading.Lock()
+
+    def _start(self) -> Popen:
+        if self._process is None or self._process.poll() is not None:
+            logging.info(' '.join(self.command))
+            process = Popen(self.command, stdin=PIPE, stdout=PIPE,
+                            stderr=PIPE, text=True, bufsize=1)
+            self._lines, self._errors = queue.Queue(), queue.Queue()
+            for stream, lines in ((process.stdout, self._lines),
+                                  (process.stderr, self._errors)):
+                threading.Thread(target=queue_lines, args=(stream, lines),
+                                 daemon=True).start()
+            self._process = process
+        return self._process
+
+    def _stop(self):
+        process, self._process = self._process, None
+        if process is not None:
+            process.kill()
+            process.wait()
+
+    def _log_errors(self):
+        while True:
+            try:
+                line = self._errors.get_nowait()
+            except queue.Empty:
+                return
+            if line.strip():
+                logging.warning(f'ts-node: {line.rstrip()}')
+
+    def prepare(self, book_path: Path) -> Dict[str, Any]:
+        with self._lock:
+            process = self._start()
+            assert process.stdin is not None
+            try:
+                process.stdin.write(f'{book_path}\n')
+                process.stdin.flush()
+                line = self._lines.get(timeout=self.timeout)
+            except BrokenPipeError:
+                line = ''
+            except queue.Empty:
+                self._stop()
+                raise Exception(
+                    f'{" ".join(self.command)}: no answer for {book_path} '
+                    f'after {self.timeout}s, restarting it')
+            finally:
+                self._log_errors()
+            if not line:
+                self._stop()
+                raise Exception(
+                    f'{" ".join(self.command)}: exited while preparing '
+                    f'{book_path}')
+        result = json.loads(line)
+        if 'error' in result:
+            raise Exception(f'{book_path}: {result["error"]}')
+        return result['meta']
+
+    def close(self):
+        with self._lock:
+            process, self._process = self._process, None
+        if process is not None:
+            assert process.stdin is not None
+            process.stdin.close()
+            process.wait()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def run_repo_prep(git: GitRepo, book_path: Path,
+                  worker: Optional[RepoPrepWorker] = None):
+    if worker is not None:
+        book_meta = worker.prepare(book_path)
+    else:
+        book_meta = json.loads(
+            sspawn(f'ts-node {REPO_PREP_SCRIPT} {book_path}'))
     git.commit_all('Add README and repository settings')
     return book_meta
 
@@ -263,12 +832,6 @@ def install_node_modules():
     update_path(node_modules/'.bin')
 
 
-def install_poet():
-    poet_dir = SCRIPT_ROOT/'poet'
-    _ = GitRepo(poet_dir, remote_repo='openstax/poet')
-    update_path(poet_dir)
-
-
 def init():
     logging.getLogger().setLevel(logging.INFO)
     env = SCRIPT_ROOT/'.env'
@@ -276,38 +839,237 @@ def init():
         for line in env.read_text().split('\n'):
             k, v = [s.strip() for s in line.split('=')]
             os.environ[k] = v
+
+
+def init_sync():
     install_node_modules()
-    install_poet()
     GitRepo.configure_secrets()
     sspawn('git config --global user.email "staxly@openstax.org"')
     sspawn('git config --global user.name "Staxly"')
 
 
-def main():
-    dry_run = (
-        False
-        if len(sys.argv) > 1 and sys.argv[1] in ('p', 'push', 'sync') else
-        True
-    )
-    approved_books = get_approved_books()
-    for book in approved_books:
-        repo = f'openstax/{book}'
-        book_path = Path(book)
-        logging.info(f'\x1b[33m========> {repo} <========\x1b[37m')
+PLAN_FIELDNAMES = ['repo', 'type', 'name']
+PLAN_WORKERS = 16
+
+
+def use_token_for_ls_remote():
+    """Lets git authenticate with $GITHUB_TOKEN without writing anything
+
+    The header is passed in the environment rather than on the command line
+    so that it is not logged.
+    """
+    github_token = os.environ.get('GITHUB_TOKEN', None)
+    if not github_token:
+        logging.warning('No GitHub creds, cannot access private repos')
+        return
+    creds = base64.b64encode(
+        f'{github_token}:x-oauth-basic'.encode('utf-8')).decode('utf-8')
+    os.environ['GIT_CONFIG_COUNT'] = '1'
+    os.environ['GIT_CONFIG_KEY_0'] = 'http.https://github.com/.extraHeader'
+    os.environ['GIT_CONFIG_VALUE_0'] = f'Authorization: Basic {creds}'
+
+
+def get_remote_refs(url: str) -> Tuple[List[str], List[str]]:
+    """The branches (as origin/<branch>) and tags of a remote"""
+    branches, tags = [], []
+    output = sspawn(f'git ls-remote --heads --tags "{url}"').decode('utf-8')
+    for line in filter(len, output.split('\n')):
+        refname = line.split('\t')[1]
+        if refname.startswith('refs/heads/'):
+            branches.append(f'origin/{refname[len("refs/heads/"):]}')
+        elif refname.startswith('refs/tags/') and not refname.endswith('^{}'):
+            tags.append(refname[len('refs/tags/'):])
+    return branches, tags
+
+
+def plan_book(book: str, clone_strategy: CloneStrategy) -> Dict[str, Any]:
+    """The branches and tags a sync would delete from a book's repo"""
+    repo = f'openstax/{book}'
+    plan: Dict[str, Any] = {
+        'repo': repo, 'branches': [], 'tags': [], 'error': None}
+    try:
+        branches_remote, tags = get_remote_refs(clone_strategy.url(repo))
+        plan['branches'] = [
+            branch.split('/', maxsplit=1)[1]
+            for branch in filter_branches_to_delete(branches_remote)]
+        plan['tags'] = tags
+    except Exception as e:
+        logging.error(f'\x1b[31m{repo}: {e}\x1b[37m')
+        plan['error'] = str(e).strip()
+    return plan
+
+
+def write_plan(plans: List[Dict[str, Any]], output_format: str):
+    if output_format == 'json':
+        json.dump(plans, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+        return
+    writer = csv.DictWriter(sys.stdout, fieldnames=PLAN_FIELDNAMES)
+    writer.writeheader()
+    for plan in plans:
+        if plan['error'] is not None:
+            writer.writerow(
+                {'repo': plan['repo'], 'type': 'error', 'name': plan['error']})
+        for branch in plan['branches']:
+            writer.writerow({'repo': plan['repo'], 'type': 'branch',
+                             'name': branch})
+        for tag in plan['tags']:
+            writer.writerow({'repo': plan['repo'], 'type': 'tag', 'name': tag})
+
+
+def run_plan(args: argparse.Namespace):
+    """Prints what a sync would delete, from `git ls-remote` alone
+
+    Nothing is cloned and nothing is written to disk.
+    """
+    use_token_for_ls_remote()
+    clone_strategy = CloneStrategy.from_env()
+    approved_books = get_approved_books(save=False)
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        plans = list(executor.map(
+            lambda book: plan_book(book, clone_strategy), approved_books))
+    write_plan(plans, args.format)
+    failed = sum(plan['error'] is not None for plan in plans)
+    logging.info(
+        f'{sum(len(plan["branches"]) for plan in plans)} branch(es) and '
+        f'{sum(len(plan["tags"]) for plan in plans)} tag(s) to delete in '
+        f'{len(plans) - failed} repo(s), {failed} repo(s) failed')
+
+
+def process_book(book: str, dry_run: bool,
+                 chunk_size: int = DELETE_CHUNK_SIZE,
+                 clone_strategy: Optional[CloneStrategy] = None,
+                 repo_prep_worker: Optional[RepoPrepWorker] = None,
+                 orphan_executor: Optional[ProcessPoolExecutor] = None,
+                 abl_entry: Optional[Dict[str, Any]] = None,
+                 run_state: Optional[RunState] = None,
+                 force: bool = False):
+    repo = f'openstax/{book}'
+    book_path = Path(book)
+    logging.info(f'\x1b[33m========> {repo} <========\x1b[37m')
+    clone_strategy = clone_strategy or CloneStrategy.from_env()
+    if run_state is not None and not force:
+        fingerprint = get_book_fingerprint(
+            clone_strategy, repo, abl_entry or {})
+        if run_state.is_current(repo, fingerprint):
+            logging.info('Nothing changed since the last sync, skipping')
+            return
+    git = GitRepo(str(book_path), remote_repo=repo,
+                  clone_strategy=clone_strategy)
+    cleanup_files(git, book_path, orphan_executor)
+    book_meta = run_repo_prep(git, book_path, repo_prep_worker)
+    ensure_correct_license(git, book_path, book_meta)
+    if not dry_run:
+        cleaned_up = cleanup_branches(git, chunk_size)
+        cleaned_up &= cleanup_tags(git, chunk_size)
+        git.push_changes()
+        if not cleaned_up:
+            logging.warning('Some branches or tags could not be deleted, '
+                            'the book will be synced again on the next run')
+        elif run_state is not None:
+            # Again, the refs changed with the push
+            run_state.record(repo, get_book_fingerprint(
+                clone_strategy, repo, abl_entry or {}))
+    else:
+        logging.info(f'Would remove {get_branches_to_delete(git)}')
+        logging.info(f'Would remove {get_tags_to_delete(git)}')
+    logging.info(f'{git.spawn_count} git process(es) for {repo}')
+
+
+def run_book(
+    book: str,
+    dry_run: bool,
+    **options: Any
+) -> Tuple[str, Optional[Exception]]:
+    with buffered_log():
         try:
-            git = GitRepo(str(book_path), remote_repo=repo)
-            cleanup_files(git, book_path)
-            book_meta = run_repo_prep(git, book_path)
-            ensure_correct_license(git, book_path, book_meta)
-            if not dry_run:
-                cleanup_branches(git)
-                cleanup_tags(git)
-                git.push_changes()
-            else:
-                print(f'Would remove {get_branches_to_delete(git)}')
-                print(f'Would remove {get_tags_to_delete(git)}')
+            process_book(book, dry_run, **options)
         except Exception as e:
-            logging.error(f'\x1b[31m{repo}: {e}\x1b[37m')
+            logging.error(f'\x1b[31mopenstax/{book}: {e}\x1b[37m')
+            return book, e
+    return book, None
+
+
+def log_summary(results: List[Tuple[str, Optional[Exception]]]):
+    failed = [(book, e) for book, e in results if e is not None]
+    logging.info(f'{len(results) - len(failed)} book(s) succeeded, '
+                 f'{len(failed)} failed')
+    for book, e in failed:
+        logging.error(f'\x1b[31mopenstax/{book}: {e}\x1b[37m')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Prepare book repositories for going public')
+    parser.add_argument(
+        'mode', nargs='?', default='dry-run',
+        help='p, push or sync to push changes, plan to print what would be '
+             'deleted from every repo, anything else is a dry run')
+    parser.add_argument(
+        '-j', '--workers', type=int,
+        help='number of books to process at the same time (default: '
+             f'$WORKERS or 1, {PLAN_WORKERS} for plan)')
+    parser.add_argument(
+        '--format', choices=('json', 'csv'), default='json',
+        help='format of the plan (default: json)')
+    parser.add_argument(
+        '--chunk-size', type=int,
+        default=int(os.environ.get('DELETE_CHUNK_SIZE', DELETE_CHUNK_SIZE)),
+        help='number of branches or tags deleted with one push (default: '
+             f'$DELETE_CHUNK_SIZE or {DELETE_CHUNK_SIZE})')
+    parser.add_argument(
+        '--clone', choices=CLONE_MODES,
+        default=os.environ.get('CLONE_MODE', 'full'),
+        help='full history, only the tip of each branch (shallow) or no file '
+             'contents until checkout (blobless) (default: $CLONE_MODE or '
+             'full)')
+    parser.add_argument(
+        '--no-mirror', action='store_true',
+        help='clone straight from the remote instead of through the local '
+             'mirrors ($GIT_MIRROR_ROOT, ./mirrors by default)')
+    parser.add_argument(
+        '-f', '--force', action='store_true',
+        help='process every book, even the ones that did not change since '
+             'their last sync')
+    args = parser.parse_args()
+    if args.workers is None and args.mode == 'plan':
+        args.workers = PLAN_WORKERS
+    elif args.workers is None:
+        args.workers = int(os.environ.get('WORKERS', '1'))
+    return args
+
+
+def main():
+    args = parse_args()
+    if args.mode == 'plan':
+        run_plan(args)
+        return
+    init_sync()
+    dry_run = args.mode not in ('p', 'push', 'sync')
+    clone_strategy = CloneStrategy.from_env(mode=args.clone)
+    if args.no_mirror:
+        clone_strategy.mirror_root = None
+    run_state = RunState()
+    approved_books = get_approved_book_entries()
+    logging.getLogger().addFilter(buffer_log_record)
+    # One pool for every book; spawned rather than forked, since forking
+    # while the book threads hold locks (logging, git) can deadlock
+    with RepoPrepWorker() as repo_prep_worker, \
+            ProcessPoolExecutor(mp_context=multiprocessing.get_context(
+                'spawn')) as orphan_executor, \
+            ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        results = list(executor.map(
+            lambda entry: run_book(
+                entry['repository_name'], dry_run,
+                chunk_size=args.chunk_size,
+                clone_strategy=clone_strategy,
+                repo_prep_worker=repo_prep_worker,
+                orphan_executor=orphan_executor,
+                abl_entry=entry,
+                run_state=run_state,
+                force=args.force),
+            approved_books))
+    log_summary(results)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,140 @@
+"""Search Benchmark: Time the xpath search pipeline against a fake archive
+Usage:
+  bench_search.py [--books=<n>] [--pages=<n>] [--matches=<n>] [--latency=<s>]
+                  [--workers=<n>] [--shard-size=<n>] [--rounds=<n>] [--cache]
+  bench_search.py (-h | --help)
+
+Options:
+  -h --help        Show this screen.
+  --books=<n>      Number of books to search [default: 25].
+  --pages=<n>      Pages in each book, the ones with matches for the query
+                   are returned [default: 200].
+  --matches=<n>    Max matches on each page [default: 10].
+  --latency=<s>    Seconds the fake archive waits before responding
+                   [default: 0.2].
+  --workers=<n>    Number of books to search concurrently [default: 8].
+  --shard-size=<n> Split the query into shards of this many expressions
+                   [default: 0].
+  --rounds=<n>     Number of times to run the search [default: 1].
+  --cache          Use a response cache, rounds after the first are warm.
+
+Examples:
+  Run from the root of the repository:
+  python -m python.bench_search --books=50 --workers=16 --rounds=2 --cache
+"""
+import os
+import resource
+import tempfile
+import time
+
+from docopt import docopt
+
+from python.self_close_xpath_search import (RESULT_FIELDNAMES,
+                                            add_additional_metadata,
+                                            search_books)
+from python.shared.analytics import MatchAnalytics
+from python.shared.cache import ResponseCache
+from python.shared.client import configure_client
+from python.shared.fake_archive import serve_fake_archive
+from python.shared.utils import CsvResultWriter
+from python.shared.xpath_planner import plan_shards
+
+XITEMS = ["//h:em[not(node())]",
+          "//h:strong[not(node())]",
+          "//h:sub[not(node())]",
+          "//h:sup[not(node())]",
+          "//h:iframe[not(node())]",
+          "//h:span[not(node())]",
+          "//h:h3[not(node())]",
+          "//h:section[not(node())]",
+          "//h:figure[not(node())]",
+          "//h:u[not(node())]",
+          "//h:a[not(node())]",
+          "//h:figcaption[not(node())]",
+          ]
+
+
+def run_round(archive_host, books, workers, shards, cache, output_dir, name):
+    """Runs the search, metadata and csv steps once and returns the counts
+
+    """
+    analytics = MatchAnalytics()
+    pages = 0
+    matches = 0
+
+    writer = CsvResultWriter(os.path.join(output_dir, name),
+                             RESULT_FIELDNAMES,
+                             datestamp=False,
+                             resume=False)
+    with writer:
+        for book, results in search_books(archive_url=f"{archive_host}/xpath.json",
+                                          books=books,
+                                          xpath_query="|".join(XITEMS),
+                                          workers=workers,
+                                          cache=cache,
+                                          shards=shards):
+            results = add_additional_metadata(book_title=book["title"],
+                                              book_uuid=book["cnx_id"],
+                                              archive_host=archive_host,
+                                              webview_staging_host="https://staging.cnx.org",
+                                              webview_prod_host="https://cnx.org",
+                                              results=results,
+                                              analytics=analytics)
+            writer.write_rows(results, key=book["cnx_id"])
+            pages += len(results)
+            matches += sum(result["total_matches"] for result in results)
+
+    analytics.save_summary(os.path.join(output_dir, f"{name}-summary"),
+                           datestamp=False)
+    return pages, matches
+
+
+def print_report(round_number, seconds, books, pages, matches, stats, peak):
+    print(f"--- round {round_number} ---")
+    print(f"elapsed:     {seconds:.2f}s")
+    print(f"throughput:  {books / seconds:.1f} books/s, "
+          f"{pages / seconds:.1f} pages/s, {matches / seconds:.1f} matches/s")
+    print(f"requests:    {stats['requests']} "
+          f"(retries: {stats['retries']}, failures: {stats['failures']})")
+    print(f"latency:     p50 {stats['p50_seconds'] * 1000:.1f}ms "
+          f"p95 {stats['p95_seconds'] * 1000:.1f}ms")
+    print(f"peak rss:    {peak / (1024 * 1024):.1f} MiB")
+
+
+def cli():
+    arguments = docopt(__doc__)
+
+    workers = int(arguments["--workers"])
+    shard_size = int(arguments["--shard-size"])
+    shards = plan_shards(XITEMS, shard_size) if shard_size else None
+    books = [{"title": f"Book {i}", "cnx_id": f"book-{i}"}
+             for i in range(int(arguments["--books"]))]
+
+    with tempfile.TemporaryDirectory() as output_dir, \
+            serve_fake_archive(latency=float(arguments["--latency"]),
+                               pages=int(arguments["--pages"]),
+                               matches=int(arguments["--matches"])) as archive_host:
+
+        cache = None
+        if arguments["--cache"]:
+            cache = ResponseCache(os.path.join(output_dir, ".cache"))
+
+        for round_number in range(1, int(arguments["--rounds"]) + 1):
+            # Pool as many keep-alive connections as requests can be in flight
+            in_flight = workers * max(1, len(shards or []))
+            client = configure_client(per_host_limit=in_flight,
+                                      pool_maxsize=in_flight)
+
+            start = time.perf_counter()
+            pages, matches = run_round(archive_host, books, workers, shards,
+                                       cache, output_dir, f"bench-{round_number}")
+            seconds = time.perf_counter() - start
+            # Peak resident size of the whole run so far, in KiB on linux
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+            print_report(round_number, seconds, len(books), pages, matches,
+                         client.stats.summary(), peak)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,198 @@
+"""REX URI Checker: Check that the urls generated by gen_book_uris.py respond
+Usage:
+  check_uris.py [<uri_file>...] [--concurrency=<n>] [--method=<method>]
+                [--timeout=<s>] [--output=<name>]
+  check_uris.py (-h | --help)
+
+Options:
+  -h --help           Show this screen.
+  --concurrency=<n>   Number of requests in flight at once [default: 50].
+  --method=<method>   HTTP method to use, HEAD or GET [default: GET].
+  --timeout=<s>       Seconds to wait for a url [default: 30].
+  --output=<name>     Name of the failures csv in ./output
+                      [default: uri-check-failures].
+
+When no uri files are given every `.txt` file in ./output is checked.
+
+Every url is requested once, following redirects. Urls that error or end in
+a 4xx/5xx status are saved with their redirect chain to the failures csv and
+a histogram of the time to first byte is printed at the end.
+
+Examples:
+  Run from the root of the repository:
+  python -m python.check_uris python/output/e42bd376-624b-4c0f-972f-e0c57998e765.txt
+
+  Check against a local stand-in (any server listed in the uri files works):
+  python -m python.check_uris /tmp/local-uris.txt --concurrency=10
+"""
+import asyncio
+import glob
+import os
+import time
+from collections import Counter
+
+import aiohttp
+from docopt import docopt
+
+from python.shared.client import percentile
+from python.shared.utils import CsvResultWriter
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+OUTPUT_DIR = os.path.join(HERE, "output")
+
+FAILURE_FIELDNAMES = ["url", "status", "error", "redirect_chain", "ttfb_ms"]
+
+# Upper bounds of the time to first byte histogram buckets, in milliseconds
+HISTOGRAM_BUCKETS = [50, 100, 250, 500, 1000, 2500, 5000, float("inf")]
+
+
+def iter_uris(filenames):
+    for filename in filenames:
+        with open(filename, "r") as infile:
+            for line in infile:
+                uri = line.strip()
+                if uri:
+                    yield uri
+
+
+async def check_uri(session, method, url):
+    """Requests a url and returns what happened
+
+    `ttfb` is the time until the response headers arrived. GET bodies are read
+    so the connection can be reused.
+
+    """
+    result = {"url": url, "status": None, "error": "", "redirect_chain": [],
+              "ttfb": None}
+    start = time.perf_counter()
+    try:
+        async with session.request(method, url, allow_redirects=True) as response:
+            result["ttfb"] = time.perf_counter() - start
+            result["status"] = response.status
+            result["redirect_chain"] = [str(r.url) for r in response.history]
+            if response.history:
+                result["redirect_chain"].append(str(response.url))
+            await response.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        result["error"] = str(e) or type(e).__name__
+    return result
+
+
+async def check_uris(uris, concurrency=50, method="GET", timeout=30):
+    """Checks every url with `concurrency` requests in flight at once
+
+    Urls are pulled from the `uris` iterator as workers free up, so the whole
+    list is never held in memory. Yields results in the order they finish.
+
+    """
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    results = asyncio.Queue()
+    done = object()
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async with aiohttp.ClientSession(connector=connector,
+                                     timeout=client_timeout) as session:
+
+        # The sentinels are always sent so a failing task cannot leave the
+        # others waiting, its exception is raised by gather at the end
+        async def produce():
+            try:
+                for uri in uris:
+                    await queue.put(uri)
+            finally:
+                for _ in range(concurrency):
+                    await queue.put(done)
+
+        async def work():
+            try:
+                while True:
+                    uri = await queue.get()
+                    if uri is done:
+                        return
+                    await results.put(await check_uri(session, method, uri))
+            finally:
+                await results.put(done)
+
+        tasks = [asyncio.ensure_future(produce())]
+        tasks.extend(asyncio.ensure_future(work()) for _ in range(concurrency))
+
+        finished = 0
+        while finished < concurrency:
+            result = await results.get()
+            if result is done:
+                finished += 1
+            else:
+                yield result
+
+        await asyncio.gather(*tasks)
+
+
+def print_histogram(ttfbs):
+    counts = Counter()
+    for ttfb in ttfbs:
+        ms = ttfb * 1000
+        counts[next(bound for bound in HISTOGRAM_BUCKETS if ms <= bound)] += 1
+
+    total = max(1, len(ttfbs))
+    lower = 0
+    print("Time to first byte:")
+    for bound in HISTOGRAM_BUCKETS:
+        label = f"{lower}-{bound}ms" if bound != float("inf") else f">{lower}ms"
+        bar = "#" * round(50 * counts[bound] / total)
+        print(f"  {label:>12} {counts[bound]:>7} {bar}")
+        lower = bound
+    print(f"  p50 {percentile(ttfbs, 50) * 1000:.0f}ms "
+          f"p95 {percentile(ttfbs, 95) * 1000:.0f}ms")
+
+
+async def run(filenames, concurrency, method, timeout, output_filename):
+    ttfbs = []
+    statuses = Counter()
+    checked = 0
+
+    with CsvResultWriter(output_filename, FAILURE_FIELDNAMES,
+                         resume=False) as writer:
+        async for result in check_uris(iter_uris(filenames), concurrency,
+                                       method, timeout):
+            checked += 1
+            statuses[result["status"] or "error"] += 1
+            if result["ttfb"] is not None:
+                ttfbs.append(result["ttfb"])
+
+            if result["error"] or result["status"] >= 400:
+                writer.write_rows([{
+                    "url": result["url"],
+                    "status": result["status"] or "",
+                    "error": result["error"],
+                    "redirect_chain": " -> ".join(result["redirect_chain"]),
+                    "ttfb_ms": (round(result["ttfb"] * 1000)
+                                if result["ttfb"] is not None else ""),
+                }])
+
+            if checked % 1000 == 0:
+                print(f"{checked} urls checked")
+
+    print(f"{checked} urls checked, {writer.rows_written} failed")
+    for status, count in sorted(statuses.items(), key=str):
+        print(f"  {status}: {count}")
+    print_histogram(ttfbs)
+
+
+def cli():
+    arguments = docopt(__doc__)
+
+    filenames = arguments["<uri_file>"] or sorted(
+        glob.glob(os.path.join(OUTPUT_DIR, "*.txt")))
+
+    asyncio.run(run(filenames,
+                    concurrency=int(arguments["--concurrency"]),
+                    method=arguments["--method"].upper(),
+                    timeout=float(arguments["--timeout"]),
+                    output_filename=os.path.join(OUTPUT_DIR, arguments["--output"])))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,162 @@
+"""Search Results Diff: Compare the results of a search before and after a fix
+Usage:
+  diff_search_results.py <before_csv> <after_csv> [--output=<name>]
+  diff_search_results.py (-h | --help)
+
+Options:
+  -h --help        Show this screen.
+  --output=<name>  Name of the report csv in ./output
+                   [default: search-results-diff].
+
+Pages are matched on their uuid and reported as fixed (only in before),
+still broken (in both) or newly broken (only in after), along with how the
+count of every tag changed. A second `<name>-tags` csv has the totals per
+tag.
+
+The report can be used as the input file of double_barrel_selenium.py to
+review only the pages that changed.
+
+Examples:
+  Run from the root of the repository:
+  python -m python.diff_search_results \\
+      python/output/production-search-results_before_fix-20190717.csv \\
+      python/output/production-search-results_after_fix-20190724.csv
+"""
+import os
+from collections import Counter
+
+from docopt import docopt
+
+from python.shared.analytics import parse_match_counts
+from python.shared.utils import get_rows_from_csv, to_csv
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+OUTPUT_DIR = os.path.join(HERE, "output")
+
+DIFF_FIELDNAMES = [
+    "uuid",
+    "status",
+    "book_title",
+    "before_matches",
+    "after_matches",
+    "tag_changes",
+    "prod_webview_url",
+    "staging_webview_url",
+]
+
+TAG_FIELDNAMES = ["tag", "before", "after", "change"]
+
+# The order pages are reported in, the ones that most need a look first
+STATUSES = ["newly broken", "still broken", "fixed"]
+
+
+def index_results(filename):
+    """Streams a results csv into a dict of page uuid -> page
+
+    A page's tag counts are added up when it shows up in more than one row,
+    which happens when a page is part of more than one book.
+
+    """
+    index = {}
+    for row in get_rows_from_csv(filename):
+        counts = parse_match_counts(row["match_counts"])
+        page = index.get(row["uuid"])
+        if page is None:
+            index[row["uuid"]] = {
+                "book_title": row["book_title"],
+                "prod_webview_url": row["prod_webview_url"],
+                "staging_webview_url": row["staging_webview_url"],
+                "counts": counts,
+            }
+        else:
+            page["counts"].update(counts)
+    return index
+
+
+def format_tag_changes(before, after):
+    changes = []
+    for tag in sorted(set(before) | set(after)):
+        change = after[tag] - before[tag]
+        if change:
+            changes.append(f"{tag}: {change:+d}")
+    return ", ".join(changes)
+
+
+def diff_results(before, after):
+    """Yields a diff row for every page in `before` or `after`
+
+    Rows come out grouped in the order of STATUSES.
+
+    """
+    empty = Counter()
+    pages = {
+        "newly broken": ((uuid, empty, page["counts"], page)
+                         for uuid, page in after.items() if uuid not in before),
+        "still broken": ((uuid, before[uuid]["counts"], page["counts"], page)
+                         for uuid, page in after.items() if uuid in before),
+        "fixed": ((uuid, page["counts"], empty, page)
+                  for uuid, page in before.items() if uuid not in after),
+    }
+
+    for status in STATUSES:
+        for uuid, before_counts, after_counts, page in pages[status]:
+            yield {
+                "uuid": uuid,
+                "status": status,
+                "book_title": page["book_title"],
+                "before_matches": sum(before_counts.values()),
+                "after_matches": sum(after_counts.values()),
+                "tag_changes": format_tag_changes(before_counts, after_counts),
+                "prod_webview_url": page["prod_webview_url"],
+                "staging_webview_url": page["staging_webview_url"],
+            }
+
+
+def diff_tag_totals(before, after):
+    before_totals = Counter()
+    for page in before.values():
+        before_totals.update(page["counts"])
+    after_totals = Counter()
+    for page in after.values():
+        after_totals.update(page["counts"])
+
+    for tag in sorted(set(before_totals) | set(after_totals)):
+        yield {
+            "tag": tag,
+            "before": before_totals[tag],
+            "after": after_totals[tag],
+            "change": after_totals[tag] - before_totals[tag],
+        }
+
+
+def cli():
+    arguments = docopt(__doc__)
+    output_filename = os.path.join(OUTPUT_DIR, arguments["--output"])
+
+    before = index_results(arguments["<before_csv>"])
+    after = index_results(arguments["<after_csv>"])
+
+    status_counts = Counter()
+
+    def counted(rows):
+        for row in rows:
+            status_counts[row["status"]] += 1
+            yield row
+
+    to_csv(DIFF_FIELDNAMES, counted(diff_results(before, after)),
+           output_filename, datestamp=False)
+
+    tag_totals = list(diff_tag_totals(before, after))
+    to_csv(TAG_FIELDNAMES, tag_totals, f"{output_filename}-tags",
+           datestamp=False)
+
+    for status in STATUSES:
+        print(f"{status}: {status_counts[status]} pages")
+    for row in tag_totals:
+        print(f"  {row['tag']}: {row['before']} -> {row['after']} "
+              f"({row['change']:+d})")
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,8 +1,11 @@
+import ast
 import os
 import random
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
 import chromedriver_binary  # Adds chromedriver binary to path
 
 from python.shared.utils import save_csv_results, get_rows_from_csv
@@ -10,6 +13,184 @@ from python.shared.utils import save_csv_results, get_rows_from_csv
 HERE = os.path.abspath(os.path.dirname(__file__))
 
 
+class BrowserPair:
+    """The browser windows used to compare pages, kept open from row to row
+
+    The windows are started and positioned side by side the first time they
+    are used. A window whose browser crashed is restarted on the next load.
+
+    """
+
+    def __init__(self, driver_mode=2):
+        self.driver_mode = driver_mode
+        self.drivers = [None] * driver_mode
+        self._screen_size = None
+
+    def _start_driver(self, index):
+        driver = webdriver.Chrome()
+
+        if self._screen_size is None:
+            driver.maximize_window()
+            size = driver.get_window_size()
+            self._screen_size = (size["width"], size["height"])
+
+        self._place(driver, index)
+        return driver
+
+    def _place(self, driver, index):
+        width, height = self._screen_size
+        driver.set_window_position(index * width // 2, 0)
+        driver.set_window_size(width // 2, height)
+
+    def _quit_driver(self, index):
+        driver = self.drivers[index]
+        self.drivers[index] = None
+        if driver is not None:
+            try:
+                driver.quit()
+            except WebDriverException:
+                pass
+
+    def _get(self, index, url):
+        if self.drivers[index] is None:
+            self.drivers[index] = self._start_driver(index)
+        self.drivers[index].get(url)
+
+    def load(self, urls, next_urls=None):
+        """Opens each url in its window, the first url in the leftmost window
+
+        `next_urls` is accepted for compatibility with PrefetchingBrowserPair
+        and is not used.
+
+        """
+        for index, url in enumerate(urls[:self.driver_mode]):
+            try:
+                self._get(index, url)
+            except WebDriverException as e:
+                print(f"Browser {index + 1} stopped responding ({e.msg}), restarting")
+                self._quit_driver(index)
+                self._get(index, url)
+
+    def park(self):
+        """Minimizes the windows, keeping whatever they have loaded
+
+        """
+        for driver in self.drivers:
+            if driver is not None:
+                driver.minimize_window()
+
+    def show(self):
+        """Puts the windows back side by side after they were parked
+
+        """
+        for index, driver in enumerate(self.drivers):
+            if driver is not None:
+                self._place(driver, index)
+
+    def quit(self):
+        for index in range(self.driver_mode):
+            self._quit_driver(index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.quit()
+
+
+class PrefetchingBrowserPair:
+    """Two BrowserPairs, one showing the current row and one loading the next
+
+    While the reviewer looks at the current row the next row's pages load in
+    the background in the parked pair. Loading that row then only swaps which
+    pair is shown.
+
+    """
+
+    def __init__(self, driver_mode=2):
+        self.current = BrowserPair(driver_mode)
+        self.spare = BrowserPair(driver_mode)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._prefetched = None
+        self._future = None
+
+    def _load_parked(self, urls):
+        self.spare.load(urls)
+        self.spare.park()
+
+    def load(self, urls, next_urls=None):
+        if self._future is not None and self._prefetched == urls:
+            try:
+                self._future.result()
+            except WebDriverException as e:
+                print(f"Prefetch failed ({e.msg}), loading the pages again")
+                self.current.load(urls)
+            else:
+                self.current, self.spare = self.spare, self.current
+                self.current.show()
+                self.spare.park()
+        else:
+            if self._future is not None:
+                self._future.cancel()
+            self.current.load(urls)
+
+        self._future = None
+        self._prefetched = None
+        if next_urls:
+            self._prefetched = next_urls
+            self._future = self._executor.submit(self._load_parked, next_urls)
+
+    def quit(self):
+        self._executor.shutdown(wait=True)
+        self.current.quit()
+        self.spare.quit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.quit()
+
+
+def get_strata(row):
+    """Returns the strata a result row belongs to, its book with each of its tags
+
+    """
+    tags = ast.literal_eval(row.get("match_tags") or "[]") or [""]
+    return [(row.get("book_title", ""), tag) for tag in tags]
+
+
+def stratified_sample(rows, per_stratum=1, rand=random):
+    """Samples up to `per_stratum` rows of each stratum from a stream of rows
+
+    Every stratum (see `get_strata`) keeps its own reservoir, so memory only
+    grows with the number of strata and rare tags are sampled as often as
+    common ones. A row in more than one stratum is returned once.
+
+    """
+    reservoirs = {}
+    seen = {}
+    for row in rows:
+        for stratum in get_strata(row):
+            reservoir = reservoirs.setdefault(stratum, [])
+            seen[stratum] = seen.get(stratum, 0) + 1
+            if len(reservoir) < per_stratum:
+                reservoir.append(row)
+            else:
+                index = rand.randrange(seen[stratum])
+                if index < per_stratum:
+                    reservoir[index] = row
+
+    sample = {}
+    for stratum in sorted(reservoirs):
+        for row in reservoirs[stratum]:
+            sample.setdefault(row["uuid"], row)
+
+    sample = list(sample.values())
+    rand.shuffle(sample)
+    return sample
+
+
 def get_user_response(prompt=">>> "):
     response = input(f"--------------------------\n"
                      f"Do the pages look correct?\n\n"
@@ -31,74 +212,66 @@ if __name__ == "__main__":
     driver_mode = 2  # Set to 1 for one browser, set to 2 for two browsers
     primary_column = "prod_webview_url"
     secondary_column = "staging_webview_url"
+    prefetch = True  # Load the next comparison in the background
+
+    # Rows are sampled per book and tag, set to None to review every row.
+    sample_per_stratum = 1
+
+    # Settings for rows pre-screened by screenshot_prescreen.py.
+    # Set diff_threshold to only review rows with a higher diff_score.
+    diff_threshold = None
 
     # Do not edit
-    driver_dos_set = False
-    result_uuids = []
+    result_uuids = set()
 
     if os.path.exists(result_output_path):
-        result_uuids = [row["uuid"] for row in get_rows_from_csv(result_output_path)]
+        result_uuids = {row["uuid"] for row in get_rows_from_csv(result_output_path)}
 
-    test_data = [row for row in get_rows_from_csv(input_file)]
+    test_data = (row for row in get_rows_from_csv(input_file)
+                 if row["uuid"] not in result_uuids
+                 and (diff_threshold is None
+                      or float(row.get("diff_score") or 1) > diff_threshold))
 
-    random_test_data = random.sample(test_data, 10)
+    if sample_per_stratum is None:
+        rows = list(test_data)
+    else:
+        rows = stratified_sample(test_data, sample_per_stratum)
 
-    counter = 0
     result_data = []
 
-    while counter <= len(random_test_data):
-
-        for row in random_test_data:
-
-            if row["uuid"] in result_uuids:
-                continue
-
-            with webdriver.Chrome() as driver_uno:
-                driver_uno.set_window_position(0, 0)
-
-                driver_uno.maximize_window()
-
-                height = driver_uno.get_window_size()["height"]
-                width = driver_uno.get_window_size()["width"]
+    columns = [primary_column]
+    if driver_mode == 2 and secondary_column:
+        columns.append(secondary_column)
 
-                driver_uno.set_window_size(height, width / 2)
+    browser_pair = PrefetchingBrowserPair if prefetch else BrowserPair
 
-                driver_uno.get(row[primary_column])
+    with browser_pair(len(columns)) as browsers:
 
-                if driver_mode == 2 and secondary_column:
+        for index, row in enumerate(rows):
 
-                        driver_dos = webdriver.Chrome()
-                        driver_dos_set = True
-                        driver_dos.set_window_position(width / 2, 0)
-                        driver_dos.set_window_size(height, width / 2)
+            next_urls = None
+            if index + 1 < len(rows):
+                next_urls = [rows[index + 1][column] for column in columns]
 
-                        driver_dos.get(row[secondary_column])
+            browsers.load([row[column] for column in columns], next_urls)
 
-                while True:
-                    response = get_user_response()
+            while True:
+                response = get_user_response()
 
-                    if response == "1":
-                        if driver_dos_set:
-                            driver_dos.close()
-                        row["result"] = "PASS"
-                        result_data.append(row)
-                        counter += 1
-                        break
-                    elif response == "2":
-                        if driver_dos_set:
-                            driver_dos.close()
-                        row["result"] = "FAIL"
-                        result_data.append(row)
-                        counter += 1
-                        break
-                    elif response == "3":
-                        if driver_dos_set:
-                            driver_dos.close()
-                        if result_data:
-                            save_csv_results(output_dir, "test-results", result_data, datestamp=False)
-                        sys.exit()
-                    else:
-                        continue
+                if response == "1":
+                    row["result"] = "PASS"
+                    result_data.append(row)
+                    break
+                elif response == "2":
+                    row["result"] = "FAIL"
+                    result_data.append(row)
+                    break
+                elif response == "3":
+                    if result_data:
+                        save_csv_results(output_dir, "test-results", result_data, datestamp=False)
+                    sys.exit()
+                else:
+                    continue
 
     if result_data:
         save_csv_results(output_dir, "test-results", result_data, mode="a", datestamp=False)
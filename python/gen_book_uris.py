@@ -1,38 +1,111 @@
 #!/usr/bin/env python
 """CNX Book URI Generator: Generate URLS for cnx.org book for testing
 Usage:
-  gen_book_urls.py <archive_host> <cnx_id>
-  gen_book_urls.py (-h | --help)
+  gen_book_uris.py <archive_host> <cnx_id>... [options]
+  gen_book_uris.py <archive_host> --all [options]
+  gen_book_uris.py (-h | --help)
+
+Options:
+  -h --help        Show this screen.
+  --all            Generate the urls of every book in BOOKS.
+  --workers=<n>    Number of books to generate concurrently [default: 4].
+  --cache-ttl=<s>  Seconds to reuse the urls generated for a book
+                   [default: 86400].
+  --refresh        Generate the urls again even when they are cached.
 
 Examples:
-  Run as an executable:
-  ./gen_book_urls.py archive-staging.cnx.org e42bd376-624b-4c0f-972f-e0c57998e765
+  Run from the root of the repository:
+  python -m python.gen_book_uris archive-staging.cnx.org e42bd376-624b-4c0f-972f-e0c57998e765
+
+  Generate several books at once:
+  python -m python.gen_book_uris archive.cnx.org 7fccc9cf-9b71-44f6-800b-f9457fd64335 \\
+      e42bd376-624b-4c0f-972f-e0c57998e765
 
-  Run using the python command:
-  python gen_book_urls archive.cnx.org 7fccc9cf-9b71-44f6-800b-f9457fd64335
+  Generate every book in BOOKS:
+  python -m python.gen_book_uris archive.cnx.org --all --workers=8
 """
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from docopt import docopt
 from rex_redirects import generate_cnx_uris
 
+from python.shared.books import BOOKS
+from python.shared.cache import ResponseCache
+
 HERE = os.path.abspath(os.path.dirname(__file__))
 
 OUTPUT_DIR = os.path.join(HERE, "output")
 
+CACHE_DIR = os.path.join(OUTPUT_DIR, ".cache")
+
+
+def get_book_uris(archive_host, cnx_id, cache=None, refresh=False):
+    """Returns the uris of a book, from `cache` when they were generated before
+
+    """
+    if cache is None:
+        return list(generate_cnx_uris(archive_host, cnx_id))
+
+    key = cache.make_key("gen_book_uris", archive_host, cnx_id)
+    entry = None if refresh else cache.get(key)
+    if entry is not None and cache.is_fresh(entry):
+        return entry["body"]
+
+    uris = list(generate_cnx_uris(archive_host, cnx_id))
+    cache.put(key, uris)
+    return uris
+
+
+def write_book_uris(archive_host, cnx_id, cache=None, refresh=False):
+    """Writes the uris of a book to `<cnx_id>.txt` in the output directory
+
+    The file is written under a temporary name first, so a file with the
+    book's name is always complete.
+
+    """
+    uris = get_book_uris(archive_host, cnx_id, cache=cache, refresh=refresh)
+    filename = os.path.join(OUTPUT_DIR, f"{cnx_id}.txt")
+    with open(f"{filename}.tmp", "w") as outfile:
+        for uri in uris:
+            outfile.write(f"{uri}\n")
+    os.replace(f"{filename}.tmp", filename)
+    return filename, len(uris)
+
 
 def cli():
     arguments = docopt(__doc__)
 
     # Assign arguments to variables
     archive_host = arguments["<archive_host>"]
-    cnx_id = arguments["<cnx_id>"]
+    if arguments["--all"]:
+        cnx_ids = [book["cnx_id"] for book in BOOKS]
+    else:
+        cnx_ids = arguments["<cnx_id>"]
 
-    with open(os.path.join(OUTPUT_DIR, f"{cnx_id}.txt"), "w") as outfile:
-        for uri in generate_cnx_uris(archive_host, cnx_id):
-            outfile.write(f"{uri}\n")
+    cache = ResponseCache(CACHE_DIR, ttl=float(arguments["--cache-ttl"]))
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=int(arguments["--workers"])) as executor:
+        futures = {
+            executor.submit(write_book_uris, archive_host, cnx_id,
+                            cache=cache, refresh=arguments["--refresh"]): cnx_id
+            for cnx_id in cnx_ids
+        }
+        for future in as_completed(futures):
+            cnx_id = futures[future]
+            try:
+                filename, total = future.result()
+            except Exception as e:
+                failed.append(cnx_id)
+                print(f"Could not generate uris for {cnx_id}: {e}")
+            else:
+                print(f"{total} uris written to {filename}")
 
-    print("uris generated successfully")
+    if failed:
+        print(f"uris could not be generated for {len(failed)} book(s)")
+    else:
+        print("uris generated successfully")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,209 @@
+"""Screenshot Pre-screen: Score how different the prod and staging pages look
+Usage:
+  screenshot_prescreen.py <input_csv> [--workers=<n>] [--width=<px>]
+                          [--max-height=<px>] [--tolerance=<n>]
+                          [--output=<name>] [--restart]
+  screenshot_prescreen.py (-h | --help)
+
+Options:
+  -h --help          Show this screen.
+  --workers=<n>      Number of headless browsers [default: 4].
+  --width=<px>       Width of the browser window [default: 1280].
+  --max-height=<px>  Tallest screenshot to take of a page [default: 8000].
+  --tolerance=<n>    How much (0-255) a pixel can change before it counts
+                     as different [default: 16].
+  --output=<name>    Name of the csv in ./output [default: prescreen-results].
+  --restart          Start a new csv instead of resuming an earlier run.
+
+Every row of the input csv (the output of self_close_xpath_search.py) gets a
+`diff_score`, the fraction of pixels that differ between the
+`prod_webview_url` and `staging_webview_url` screenshots, and a
+`diff_image` highlighting where they differ. Use the csv as the input file of
+double_barrel_selenium.py with a `diff_threshold` to only review the rows
+that changed.
+
+Examples:
+  Run from the root of the repository:
+  python -m python.screenshot_prescreen \\
+      python/output/production-search-results_before_fix-20190717.csv --workers=8
+"""
+import csv
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from docopt import docopt
+from PIL import Image, ImageChops
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+import chromedriver_binary  # Adds chromedriver binary to path
+
+from python.shared.utils import (CsvResultWriter,
+                                 get_rows_from_csv,
+                                 make_destination_folder)
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+OUTPUT_DIR = os.path.join(HERE, "output")
+
+DIFF_FIELDNAMES = ["diff_score", "diff_image", "diff_error"]
+
+
+class HeadlessBrowsers:
+    """One headless Chrome per worker thread, started when first needed
+
+    """
+
+    def __init__(self, width=1280, max_height=8000):
+        self.width = width
+        self.max_height = max_height
+        self._local = threading.local()
+        self._drivers = []
+        self._lock = threading.Lock()
+
+    def _start_driver(self):
+        options = webdriver.ChromeOptions()
+        options.add_argument("--headless")
+        options.add_argument("--hide-scrollbars")
+        options.add_argument(f"--window-size={self.width},1000")
+        driver = webdriver.Chrome(options=options)
+        with self._lock:
+            self._drivers.append(driver)
+        return driver
+
+    @property
+    def driver(self):
+        if getattr(self._local, "driver", None) is None:
+            self._local.driver = self._start_driver()
+        return self._local.driver
+
+    def restart(self):
+        driver = getattr(self._local, "driver", None)
+        self._local.driver = None
+        if driver is not None:
+            with self._lock:
+                self._drivers.remove(driver)
+            try:
+                driver.quit()
+            except WebDriverException:
+                pass
+
+    def screenshot(self, url):
+        """Returns a screenshot of the whole page at `url` (up to max_height)
+
+        """
+        driver = self.driver
+        driver.set_window_size(self.width, 1000)
+        driver.get(url)
+        height = driver.execute_script(
+            "return document.documentElement.scrollHeight")
+        driver.set_window_size(self.width, min(height, self.max_height))
+        return Image.open(io.BytesIO(driver.get_screenshot_as_png())).convert("RGB")
+
+    def quit(self):
+        with self._lock:
+            drivers, self._drivers = self._drivers, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except WebDriverException:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.quit()
+
+
+def diff_images(image_a, image_b, tolerance=16):
+    """Returns the fraction of pixels that differ and an image of the differences
+
+    Images of different sizes are compared on a canvas big enough for both,
+    so anything only one of them covers counts as different.
+
+    """
+    size = (max(image_a.width, image_b.width), max(image_a.height, image_b.height))
+    canvas_a = Image.new("RGB", size)
+    canvas_a.paste(image_a)
+    canvas_b = Image.new("RGB", size)
+    canvas_b.paste(image_b)
+
+    difference = ImageChops.difference(canvas_a, canvas_b).convert("L")
+    mask = difference.point(lambda value: 255 if value > tolerance else 0)
+
+    changed = mask.histogram()[255]
+    score = changed / (size[0] * size[1])
+
+    highlight = Image.new("RGB", size, (255, 0, 0))
+    diff_image = Image.blend(canvas_b, Image.new("RGB", size, (255, 255, 255)), 0.7)
+    diff_image.paste(highlight, mask=mask)
+    return score, diff_image
+
+
+def prescreen_row(browsers, row, diff_dir, tolerance=16):
+    """Screenshots both urls of a row and adds the diff columns to it
+
+    A row whose pages could not be loaded gets a score of 1 so it is always
+    reviewed.
+
+    """
+    try:
+        try:
+            prod = browsers.screenshot(row["prod_webview_url"])
+            staging = browsers.screenshot(row["staging_webview_url"])
+        except WebDriverException:
+            browsers.restart()
+            raise
+    except WebDriverException as e:
+        row.update(diff_score=1.0, diff_image="", diff_error=e.msg)
+        return row
+
+    score, diff_image = diff_images(prod, staging, tolerance)
+    image_path = ""
+    if score > 0:
+        image_path = os.path.join(diff_dir, f"{row['uuid']}.png")
+        diff_image.save(image_path)
+
+    row.update(diff_score=round(score, 6), diff_image=image_path, diff_error="")
+    return row
+
+
+def cli():
+    arguments = docopt(__doc__)
+    input_file = arguments["<input_csv>"]
+    output_filename = os.path.join(OUTPUT_DIR, arguments["--output"])
+    diff_dir = os.path.join(OUTPUT_DIR, f"{arguments['--output']}-images")
+    tolerance = int(arguments["--tolerance"])
+    make_destination_folder(diff_dir)
+
+    with open(input_file, "r", encoding="ISO-8859-1") as infile:
+        fieldnames = next(csv.reader(infile))
+
+    writer = CsvResultWriter(output_filename,
+                             [f for f in fieldnames if f not in DIFF_FIELDNAMES]
+                             + DIFF_FIELDNAMES,
+                             datestamp=False,
+                             resume=not arguments["--restart"])
+
+    rows = (row for row in get_rows_from_csv(input_file)
+            if row["uuid"] not in writer.completed)
+
+    with writer, \
+            HeadlessBrowsers(width=int(arguments["--width"]),
+                             max_height=int(arguments["--max-height"])) as browsers, \
+            ThreadPoolExecutor(max_workers=int(arguments["--workers"])) as executor:
+
+        def prescreen(row):
+            return prescreen_row(browsers, row, diff_dir, tolerance)
+
+        for row in executor.map(prescreen, rows):
+            writer.write_rows([row], key=row["uuid"])
+            print(f"{row['diff_score']:.4f} {row['prod_webview_url']}")
+
+    print(f"{writer.rows_written} rows saved to {writer.filename}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,97 @@
+import ast
+import re
+from collections import Counter
+
+from python.shared.utils import to_csv
+
+# Matches the tag name at the start of a serialized element, skipping any
+# namespace prefix, e.g. "span" in '<span xmlns="..." data-type="title"/>'
+TAG_PATTERN = re.compile(r"<(?:[\w.-]+:)?([\w.-]+)")
+
+SUMMARY_FIELDNAMES = ["scope", "book_title", "tag", "count", "pages"]
+
+
+def count_tags(matches):
+    """Returns a Counter of the tag names in a list of matches
+
+    """
+    search = TAG_PATTERN.search
+    counts = Counter()
+    for match in matches:
+        tag = search(match)
+        if tag:
+            counts[tag.group(1)] += 1
+    return counts
+
+
+def parse_match_counts(value):
+    """Returns a Counter from the `match_counts` column of a results csv
+
+    Example:
+        "['span: 2', 'em: 1']"
+
+    returns Counter({"span": 2, "em": 1})
+
+    """
+    counts = Counter()
+    for item in ast.literal_eval(value or "[]"):
+        tag, _, count = item.rpartition(": ")
+        counts[tag] += int(count)
+    return counts
+
+
+class MatchAnalytics:
+    """Tag counts built up one page at a time, per book and for the catalog
+
+    For every tag it keeps the number of matches and the number of pages the
+    tag was found on.
+
+    """
+
+    def __init__(self):
+        self.book_counts = {}
+        self.book_pages = {}
+        self.catalog_counts = Counter()
+        self.catalog_pages = Counter()
+
+    def add_page(self, book_title, tag_counts):
+        if book_title not in self.book_counts:
+            self.book_counts[book_title] = Counter()
+            self.book_pages[book_title] = Counter()
+
+        self.book_counts[book_title].update(tag_counts)
+        self.book_pages[book_title].update(tag_counts.keys())
+        self.catalog_counts.update(tag_counts)
+        self.catalog_pages.update(tag_counts.keys())
+
+    def add_csv_row(self, row):
+        """Adds a page from a row of a results csv that was already written
+
+        """
+        self.add_page(row["book_title"], parse_match_counts(row["match_counts"]))
+
+    def summary_rows(self):
+        for book_title, counts in self.book_counts.items():
+            pages = self.book_pages[book_title]
+            for tag, count in counts.most_common():
+                yield {"scope": "book",
+                       "book_title": book_title,
+                       "tag": tag,
+                       "count": count,
+                       "pages": pages[tag]}
+
+        for tag, count in self.catalog_counts.most_common():
+            yield {"scope": "catalog",
+                   "book_title": "",
+                   "tag": tag,
+                   "count": count,
+                   "pages": self.catalog_pages[tag]}
+
+    def save_summary(self, filename, datestamp=True):
+        to_csv(SUMMARY_FIELDNAMES, self.summary_rows(), filename,
+               datestamp=datestamp)
+
+    def print_summary(self):
+        print("Matches per tag across all books:")
+        for tag, count in self.catalog_counts.most_common():
+            print(f"  {tag}: {count} ({self.catalog_pages[tag]} pages)")
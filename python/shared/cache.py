@@ -0,0 +1,127 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from python.shared.client import get_client
+from python.shared.utils import make_destination_folder
+
+
+class CacheMissError(Exception):
+    """Raised when a response is needed but the cache is used offline
+
+    """
+
+
+class ResponseCache:
+    """A json response cache stored as one file per key in `cache_dir`
+
+    Entries older than `ttl` seconds are revalidated before they are used and
+    the least recently used entries are removed once the cache grows past
+    `max_bytes`.
+
+    """
+
+    def __init__(self, cache_dir, ttl=24 * 60 * 60, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        make_destination_folder(cache_dir)
+
+    @staticmethod
+    def make_key(*parts):
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r") as infile:
+                entry = json.load(infile)
+        except (OSError, ValueError):
+            return None
+        # The file modification time is what the eviction order is based on
+        os.utime(path)
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    def put(self, key, body, etag=None, last_modified=None):
+        entry = {
+            "fetched_at": time.time(),
+            "etag": etag,
+            "last_modified": last_modified,
+            "body": body,
+        }
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as outfile:
+            json.dump(entry, outfile)
+        os.replace(tmp_path, path)
+        self.evict()
+        return entry
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for dir_entry in os.scandir(self.cache_dir):
+                if not dir_entry.name.endswith(".json"):
+                    continue
+                stat = dir_entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+                total += stat.st_size
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+def get_cached_json(url, params, cache, key, offline=False):
+    """Returns the json response for `url`, using `cache` when possible
+
+    Fresh entries are returned as is. Stale entries are revalidated with
+    If-None-Match/If-Modified-Since when the server gave us an ETag or a
+    Last-Modified header. When `offline` is set the network is never used and
+    a CacheMissError is raised for anything that is not cached.
+
+    """
+    entry = cache.get(key)
+
+    if entry is not None and (offline or cache.is_fresh(entry)):
+        return entry["body"]
+
+    if offline:
+        raise CacheMissError(f"{url} {params} is not cached")
+
+    headers = {}
+    if entry is not None:
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = get_client().get(url, params=params, headers=headers)
+
+    if response.status_code == 304 and entry is not None:
+        cache.put(key, entry["body"], entry["etag"], entry["last_modified"])
+        return entry["body"]
+
+    response.raise_for_status()
+    body = response.json()
+    cache.put(key,
+              body,
+              etag=response.headers.get("ETag"),
+              last_modified=response.headers.get("Last-Modified"))
+    return body
@@ -0,0 +1,191 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+def percentile(values, pct):
+    """Returns the `pct` percentile of `values` using the nearest-rank method
+
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class ClientStats:
+    """Thread safe counters for the requests made by an HttpClient
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.latencies = []
+
+    def record_request(self, seconds):
+        with self._lock:
+            self.requests += 1
+            self.latencies.append(seconds)
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+
+    def summary(self):
+        with self._lock:
+            latencies = list(self.latencies)
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "total_seconds": sum(latencies),
+                "p50_seconds": percentile(latencies, 50),
+                "p95_seconds": percentile(latencies, 95),
+                "max_seconds": max(latencies, default=0.0),
+            }
+
+    def print_summary(self):
+        s = self.summary()
+        print(f"HTTP requests: {s['requests']} "
+              f"(retries: {s['retries']}, failures: {s['failures']})")
+        print(f"HTTP latency: p50 {s['p50_seconds']:.3f}s "
+              f"p95 {s['p95_seconds']:.3f}s max {s['max_seconds']:.3f}s")
+
+
+class HttpClient:
+    """A keep-alive http client shared by the scripts
+
+    Connections are pooled per host, requests that fail with a connection
+    error, a timeout or one of `RETRY_STATUSES` are retried with exponential
+    backoff and jitter, and no more than `per_host_limit` requests are in
+    flight against the same host at once.
+
+    """
+
+    def __init__(self,
+                 timeout=(5, 120),
+                 max_retries=4,
+                 backoff_factor=0.5,
+                 backoff_max=30,
+                 per_host_limit=8,
+                 pool_maxsize=16):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.per_host_limit = per_host_limit
+        self.stats = ClientStats()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_maxsize,
+                              pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._host_locks = defaultdict(
+            lambda: threading.BoundedSemaphore(self.per_host_limit))
+        self._host_locks_lock = threading.Lock()
+
+    def _host_semaphore(self, url):
+        host = urlsplit(url).netloc
+        with self._host_locks_lock:
+            return self._host_locks[host]
+
+    def _backoff(self, attempt, response=None):
+        retry_after = None
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.backoff_max)
+        delay = min(self.backoff_factor * (2 ** attempt), self.backoff_max)
+        return random.uniform(0, delay)
+
+    def request(self, method, url, params=None, headers=None, data=None):
+        """Does a request and returns the response, retrying transient errors
+
+        The response is returned without checking the status code, so callers
+        can handle things like `304 Not Modified` themselves.
+
+        """
+        attempt = 0
+        while True:
+            response = None
+            error = None
+            start = time.perf_counter()
+            try:
+                with self._host_semaphore(url):
+                    response = self.session.request(method,
+                                                    url,
+                                                    params=params,
+                                                    headers=headers,
+                                                    data=data,
+                                                    timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            finally:
+                self.stats.record_request(time.perf_counter() - start)
+
+            if error is None and response.status_code not in RETRY_STATUSES:
+                return response
+
+            if attempt >= self.max_retries:
+                self.stats.record_failure()
+                if error is not None:
+                    raise error
+                return response
+
+            self.stats.record_retry()
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+    def get(self, url, params=None, headers=None):
+        return self.request("GET", url, params=params, headers=headers)
+
+    def post(self, url, data, params=None, headers=None):
+        return self.request("POST", url, params=params, headers=headers,
+                            data=data)
+
+    def get_json(self, url, params=None, headers=None):
+        response = self.get(url, params=params, headers=headers)
+        response.raise_for_status()
+        return response.json()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client():
+    """Returns the http client shared by everything in the process
+
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
+
+
+def configure_client(**kwargs):
+    """Replaces the shared http client with one built from `kwargs`
+
+    """
+    global _default_client
+    with _default_client_lock:
+        _default_client = HttpClient(**kwargs)
+        return _default_client
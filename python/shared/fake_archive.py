@@ -0,0 +1,101 @@
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+QUERY_TAG_PATTERN = re.compile(r"//h:(\w+)")
+
+# The tags a made up page can have matches for
+FAKE_TAGS = ["em", "strong", "sub", "sup", "iframe", "span", "h3", "section",
+             "figure", "u", "a", "figcaption"]
+
+
+class FakeArchiveHandler(BaseHTTPRequestHandler):
+    """A stand-in for archive's /xpath.json that makes up its results
+
+    Every book has the same made up matches on every request and a query only
+    gets the ones for the tags it asks for. The server's `latency`, `pages`
+    and `matches` attributes set how long a response takes and how big it is.
+
+    """
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != "/xpath.json":
+            self.send_error(404)
+            return
+
+        params = parse_qs(url.query)
+        cnx_id = params.get("id", [""])[0]
+        query = params.get("q", [""])[0]
+
+        time.sleep(self.server.latency)
+
+        body = json.dumps(self.make_results(cnx_id, query)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def make_results(self, cnx_id, query):
+        """Returns the made up matches of a book whose tag is in the query
+
+        The matches of every page are picked once per book and page, so a
+        query split into shards finds the same matches as the whole query.
+
+        """
+        tags = set(QUERY_TAG_PATTERN.findall(query))
+        results = []
+        for page in range(self.server.pages):
+            page_uuid = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{cnx_id}/{page}"))
+            rand = random.Random(f"{cnx_id}/{page}")
+            matches = []
+            for i in range(rand.randint(1, self.server.matches)):
+                tag = rand.choice(FAKE_TAGS)
+                if tag in tags:
+                    matches.append(f'<{tag} xmlns="http://www.w3.org/1999/xhtml" '
+                                   f'id="auto_{page_uuid}_{i}"/>')
+            if matches:
+                results.append({
+                    "uuid": page_uuid,
+                    "uri": f"/contents/{cnx_id}:{page_uuid}.html",
+                    "matches": matches,
+                })
+        return results
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeArchiveServer(ThreadingHTTPServer):
+    # The default listen backlog of 5 makes connections past it wait a second
+    # for a SYN retry, which would be timed instead of the client
+    request_queue_size = 128
+
+
+@contextmanager
+def serve_fake_archive(latency=0.05, pages=50, matches=5):
+    """Runs a FakeArchiveHandler server on a free local port
+
+    Yields the server's base url, e.g. "http://127.0.0.1:54321"
+
+    """
+    server = FakeArchiveServer(("127.0.0.1", 0), FakeArchiveHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.pages = pages
+    server.matches = matches
+
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,129 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+
+from lxml import etree, html
+
+XHTML_NS = "http://www.w3.org/1999/xhtml"
+
+# The same prefixes archive's xpath.json endpoint understands
+NAMESPACES = {
+    "h": XHTML_NS,
+    "m": "http://www.w3.org/1998/Math/MathML",
+    "epub": "http://www.idpf.org/2007/ops",
+}
+
+PAGE_SUFFIXES = ("", ".html", ".xhtml")
+
+
+@lru_cache(maxsize=None)
+def compile_xpath(xpath_query):
+    return etree.XPath(xpath_query, namespaces=NAMESPACES)
+
+
+def parse_page(path):
+    """Parses a baked page into an lxml tree with elements in the xhtml namespace
+
+    Baked XHTML is parsed as xml so that self closing tags are kept as they
+    are. Anything else (i.e. pages prerendered by rex) is parsed as html, the
+    way a browser would, and its elements are moved into the xhtml namespace so
+    the `h:` queries match them.
+
+    """
+    with open(path, "rb") as infile:
+        head = infile.read(2048)
+
+    if head.lstrip().startswith(b"<?xml") or XHTML_NS.encode() in head:
+        parser = etree.XMLParser(recover=True, huge_tree=True,
+                                 resolve_entities=False)
+        return etree.parse(path, parser).getroot()
+
+    root = html.parse(path).getroot()
+    if root is None:
+        return None
+
+    xhtml_root = etree.Element(f"{{{XHTML_NS}}}{root.tag}", root.attrib,
+                               nsmap={None: XHTML_NS})
+    xhtml_root.text = root.text
+    xhtml_root.extend(root)
+    for el in xhtml_root.iter(tag=etree.Element):
+        if not el.tag.startswith("{"):
+            el.tag = f"{{{XHTML_NS}}}{el.tag}"
+    return xhtml_root
+
+
+def page_uuid(path):
+    """Returns the page uuid from a path like `<uuid>@<version>.xhtml`
+
+    """
+    name = os.path.basename(path)
+    name = re.sub(r"\.x?html$", "", name)
+    return name.split("@")[0].split(":")[-1]
+
+
+def search_page(path, xpath_query, root_dir):
+    """Evaluates the query on one page and returns a result shaped like archive's
+
+    Returns None when nothing matches.
+
+    """
+    root = parse_page(path)
+    if root is None:
+        return None
+
+    matches = [
+        etree.tostring(match, encoding="unicode", with_tail=False)
+        if isinstance(match, etree._Element) else str(match)
+        for match in compile_xpath(xpath_query)(root)
+    ]
+    if not matches:
+        return None
+
+    return {
+        "uuid": page_uuid(path),
+        "uri": os.path.relpath(path, root_dir).replace(os.sep, "/"),
+        "matches": matches,
+    }
+
+
+def iter_book_pages(book_dir):
+    """Yields the page files of a baked book, sorted by name
+
+    Pages are looked for in `<book_dir>/pages` (the rex build layout) and fall
+    back to the book directory itself.
+
+    """
+    pages_dir = os.path.join(book_dir, "pages")
+    if not os.path.isdir(pages_dir):
+        pages_dir = book_dir
+
+    for entry in sorted(os.scandir(pages_dir), key=lambda e: e.name):
+        if entry.is_file() and os.path.splitext(entry.name)[1] in PAGE_SUFFIXES:
+            yield entry.path
+
+
+def search_book(executor, book_dir, xpath_query, root_dir):
+    search = partial(search_page, xpath_query=xpath_query, root_dir=root_dir)
+    results = executor.map(search, iter_book_pages(book_dir), chunksize=16)
+    return [result for result in results if result is not None]
+
+
+def search_local_books(books_path, xpath_query, workers=None, skip=()):
+    """Does the xpath search on every book directory in `books_path`
+
+    Pages are spread across a pool of `workers` processes. Yields a
+    (book, results) tuple per book, sorted by directory name, where book has
+    the same keys as the entries in `BOOKS`. Books named in `skip` are left
+    out.
+
+    """
+    book_dirs = sorted(entry.path for entry in os.scandir(books_path)
+                       if entry.is_dir() and entry.name not in skip)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for book_dir in book_dirs:
+            name = os.path.basename(book_dir)
+            print(f"Searching [{name}] in {book_dir}")
+            book = {"title": name, "cnx_id": name}
+            yield book, search_book(executor, book_dir, xpath_query, books_path)
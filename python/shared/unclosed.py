@@ -0,0 +1,90 @@
+from html.parser import HTMLParser
+
+VOID_ELEMENTS = frozenset([
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "link",
+    "meta", "param", "source", "track", "wbr",
+])
+
+# Elements html lets you leave the end tag out of, not worth flagging
+OPTIONAL_END_TAGS = frozenset([
+    "html", "head", "body", "p", "li", "dt", "dd", "option", "optgroup",
+    "tr", "td", "th", "thead", "tbody", "tfoot", "colgroup", "caption",
+    "rb", "rt", "rtc", "rp",
+])
+
+# Self closing tags are fine inside these
+FOREIGN_ELEMENTS = frozenset(["svg", "math"])
+
+
+class UnclosedElementChecker(HTMLParser):
+    """Finds self closed and unclosed non-void elements in a stream of html
+
+    Only the stack of open elements is kept, so memory does not grow with the
+    size of the page. Feed it with `feed` and call `close` at the end, the
+    problems found are in `problems` as (kind, tag, line) tuples.
+
+    """
+
+    def __init__(self, max_problems=100):
+        super().__init__(convert_charrefs=False)
+        self.max_problems = max_problems
+        self.problems = []
+        self._stack = []
+        self._foreign_depth = 0
+
+    def _add_problem(self, kind, tag, line):
+        if len(self.problems) < self.max_problems:
+            self.problems.append((kind, tag, line))
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_ELEMENTS and not self._foreign_depth:
+            return
+        if tag in FOREIGN_ELEMENTS:
+            self._foreign_depth += 1
+        self._stack.append((tag, self.getpos()[0]))
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in VOID_ELEMENTS or self._foreign_depth:
+            return
+        self._add_problem("self-closed", tag, self.getpos()[0])
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS and not self._foreign_depth:
+            return
+
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index][0] == tag:
+                break
+        else:
+            self._add_problem("stray end tag", tag, self.getpos()[0])
+            return
+
+        # Everything opened after the element being closed was left open
+        while len(self._stack) > index:
+            open_tag, line = self._stack.pop()
+            if open_tag in FOREIGN_ELEMENTS:
+                self._foreign_depth -= 1
+            if len(self._stack) > index and open_tag not in OPTIONAL_END_TAGS:
+                self._add_problem("unclosed", open_tag, line)
+
+    def close(self):
+        super().close()
+        while self._stack:
+            open_tag, line = self._stack.pop()
+            if open_tag not in OPTIONAL_END_TAGS:
+                self._add_problem("unclosed", open_tag, line)
+
+
+def check_page(path, chunk_size=64 * 1024):
+    """Streams a page through an UnclosedElementChecker and returns its problems
+
+    """
+    checker = UnclosedElementChecker()
+    with open(path, "r", encoding="utf-8", errors="replace") as infile:
+        while True:
+            chunk = infile.read(chunk_size)
+            if not chunk:
+                break
+            checker.feed(chunk)
+    checker.close()
+    return checker.problems
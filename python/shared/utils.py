@@ -2,7 +2,7 @@ import csv
 import os
 from datetime import datetime
 
-import requests
+from python.shared.client import get_client
 
 
 def make_destination_folder(folder):
@@ -10,11 +10,14 @@ def make_destination_folder(folder):
         os.makedirs(folder)
 
 
-def to_csv(fieldnames, collection, filename, mode="w", datestamp=True):
+def csv_filename(filename, datestamp=True):
     if datestamp:
-        filename = f"{filename}-{datetime.now().strftime('%Y%m%d')}.csv"
-    else:
-        filename = f"{filename}.csv"
+        return f"{filename}-{datetime.now().strftime('%Y%m%d')}.csv"
+    return f"{filename}.csv"
+
+
+def to_csv(fieldnames, collection, filename, mode="w", datestamp=True):
+    filename = csv_filename(filename, datestamp)
 
     print(f"Saving csv file to {filename}")
 
@@ -40,6 +43,83 @@ def save_csv_results(output_dir, filename, results, mode="w", datestamp=True):
     to_csv(fieldnames, results, result_path, mode=mode, datestamp=datestamp)
 
 
+class CsvResultWriter:
+    """Writes rows to a csv file as they come in, using a fixed set of columns
+
+    Every call to `write_rows` is flushed to disk before it returns. When it is
+    given a `key` (e.g. a book id) the key and the size of the file are
+    appended to a `.checkpoint` file next to the csv. Opening the writer again
+    with `resume=True` truncates anything written after the last checkpoint
+    and exposes the finished keys in `completed`, so they can be skipped.
+
+    Columns not in `fieldnames` are dropped and missing ones are left empty.
+
+    """
+
+    def __init__(self, filename, fieldnames, datestamp=True, resume=True):
+        self.filename = csv_filename(filename, datestamp)
+        self.checkpoint_filename = f"{self.filename}.checkpoint"
+        self.fieldnames = list(fieldnames)
+        self.completed = set()
+        self.rows_written = 0
+
+        make_destination_folder(os.path.dirname(os.path.abspath(self.filename)))
+
+        offset = None
+        if resume and os.path.exists(self.checkpoint_filename):
+            with open(self.checkpoint_filename, "r") as checkpoint:
+                for line in checkpoint:
+                    key, _, size = line.rstrip("\n").rpartition("\t")
+                    if key:
+                        self.completed.add(key)
+                        offset = int(size)
+
+        if offset is not None and os.path.exists(self.filename):
+            print(f"Resuming csv file {self.filename} "
+                  f"({len(self.completed)} completed)")
+            self._outfile = open(self.filename, "r+", newline="")
+            self._outfile.truncate(offset)
+            self._outfile.seek(offset)
+            self._writer = self._dict_writer()
+        else:
+            print(f"Saving csv file to {self.filename}")
+            self.completed = set()
+            self._outfile = open(self.filename, "w", newline="")
+            self._writer = self._dict_writer()
+            self._writer.writeheader()
+            self._flush()
+            if os.path.exists(self.checkpoint_filename):
+                os.remove(self.checkpoint_filename)
+
+    def _dict_writer(self):
+        return csv.DictWriter(self._outfile, self.fieldnames, dialect='excel',
+                              restval="", extrasaction="ignore")
+
+    def _flush(self):
+        self._outfile.flush()
+        os.fsync(self._outfile.fileno())
+
+    def write_rows(self, rows, key=None):
+        for row in rows:
+            self._writer.writerow(row)
+            self.rows_written += 1
+        self._flush()
+
+        if key is not None:
+            with open(self.checkpoint_filename, "a") as checkpoint:
+                checkpoint.write(f"{key}\t{self._outfile.tell()}\n")
+            self.completed.add(key)
+
+    def close(self):
+        self._outfile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
 def get_rows_from_csv(filename):
     with open(filename, 'r', encoding='ISO-8859-1') as csvfile:
         datareader = csv.DictReader(csvfile)
@@ -50,6 +130,4 @@ def get_rows_from_csv(filename):
 def get_json_reponse(url, **kwargs):
     params = kwargs
 
-    r = requests.get(url, params=params)
-    r.raise_for_status()
-    return r.json()
+    return get_client().get_json(url, params=params)
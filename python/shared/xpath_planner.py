@@ -0,0 +1,90 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+
+def plan_shards(expressions, shard_size=1):
+    """Groups xpath expressions into union queries of `shard_size` expressions
+
+    Example:
+        plan_shards(["//h:em", "//h:sub", "//h:sup"], shard_size=2)
+
+    returns ["//h:em|//h:sub", "//h:sup"]
+
+    """
+    shard_size = max(1, shard_size)
+    return ["|".join(expressions[i:i + shard_size])
+            for i in range(0, len(expressions), shard_size)]
+
+
+def merge_shard_results(shard_results):
+    """Merges the results of several shards into one result per page
+
+    Pages are kept in the order they are first seen. The same element can
+    match more than one shard, but distinct elements can also serialize to
+    the same string (e.g. two empty spans), so each match is kept as many
+    times as the most any one shard found it on the page.
+
+    """
+    pages = {}
+    for results in shard_results:
+        for result in results:
+            page = pages.get(result["uri"])
+            if page is None:
+                page = pages[result["uri"]] = dict(result, matches=[])
+                kept = page["_kept"] = Counter()
+            else:
+                kept = page["_kept"]
+            for match, count in Counter(result["matches"]).items():
+                if count > kept[match]:
+                    page["matches"].extend([match] * (count - kept[match]))
+                    kept[match] = count
+
+    for page in pages.values():
+        del page["_kept"]
+    return list(pages.values())
+
+
+def run_shard(search, query, attempts=3, retry_on=(IOError, ValueError)):
+    """Runs `search(query)`, retrying this shard alone when it fails
+
+    Returns a (results, timing) tuple where timing has the query, the seconds
+    spent on the successful attempt, the number of attempts and of pages.
+
+    """
+    attempt = 1
+    while True:
+        start = time.perf_counter()
+        try:
+            results = search(query)
+        except retry_on as e:
+            if attempt >= attempts:
+                raise
+            print(f"Shard {query} failed ({e}), retrying")
+            time.sleep(2 ** attempt)
+            attempt += 1
+            continue
+
+        timing = {
+            "query": query,
+            "seconds": time.perf_counter() - start,
+            "attempts": attempt,
+            "pages": len(results),
+        }
+        return results, timing
+
+
+def run_sharded(search, shards, attempts=3, retry_on=(IOError, ValueError)):
+    """Runs every shard concurrently and merges the results
+
+    Returns a (results, timings) tuple with one timing per shard, in the same
+    order as `shards`.
+
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(shards))) as executor:
+        done = list(executor.map(
+            lambda query: run_shard(search, query, attempts, retry_on),
+            shards))
+
+    results = merge_shard_results(results for results, _ in done)
+    return results, [timing for _, timing in done]
@@ -0,0 +1,231 @@
+"""HTML Validator: Validate rex pages against a local W3C (vnu) validator
+Usage:
+  validate_html.py [<books_path>] [--validator=<url>] [--workers=<n>]
+                   [--all-errors] [--output=<name>] [--no-cache]
+                   [--precheck | --precheck-only]
+  validate_html.py (-h | --help)
+
+Options:
+  -h --help          Show this screen.
+  --validator=<url>  Url of the vnu validator [default: http://localhost:8888/].
+  --workers=<n>      Number of pages to validate at once [default: 8].
+  --all-errors       Report every error, not just "Unclosed element".
+  --output=<name>    Name of the results in ./output
+                     [default: validation-results].
+  --no-cache         Validate pages that were clean on an earlier run again.
+  --precheck         Only send pages with self closed or unclosed elements
+                     (found by a quick local check) to the validator.
+  --precheck-only    Report what the local check finds, without a validator.
+
+Validates every page in `<books_path>/<book>/pages` (the $BOOKS_PATH of
+bash/w3c_rex/w3c_rex.sh, ./build/books by default). Pages whose content has
+not changed since they were last found clean are skipped.
+
+The errors of every page are deduplicated and saved to `<name>.csv`, one row
+per book and page, and to `<name>.json`, grouped by book.
+
+Examples:
+  Run from the root of the repository, with the validator running:
+  python -m python.validate_html /path/to/rex-web/build/books --workers=16
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from docopt import docopt
+
+from python.shared.client import configure_client
+from python.shared.local_xpath import iter_book_pages
+from python.shared.unclosed import check_page
+from python.shared.utils import CsvResultWriter, make_destination_folder
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+
+OUTPUT_DIR = os.path.join(HERE, "output")
+
+# Kept out of ./output/.cache, whose *.json files the response cache evicts
+CACHE_FILE = os.path.join(OUTPUT_DIR, ".validation-clean.json")
+
+RESULT_FIELDNAMES = ["book", "page", "error_count", "errors"]
+
+ERROR_FILTER = "Unclosed element"
+
+
+class CleanPageCache:
+    """Remembers the content hash of every page that validated clean
+
+    Pages are keyed by their path together with the validator and the errors
+    that were looked for, since a page clean of one kind of error can still
+    have others.
+
+    """
+
+    def __init__(self, filename, enabled=True):
+        self.filename = filename
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._hashes = {}
+        if enabled and os.path.exists(filename):
+            with open(filename, "r") as infile:
+                self._hashes = json.load(infile)
+
+    def is_clean(self, path, content_hash):
+        return self.enabled and self._hashes.get(path) == content_hash
+
+    def set(self, path, content_hash, clean):
+        with self._lock:
+            if clean:
+                self._hashes[path] = content_hash
+            else:
+                self._hashes.pop(path, None)
+
+    def save(self):
+        make_destination_folder(os.path.dirname(self.filename))
+        with self._lock:
+            with open(f"{self.filename}.tmp", "w") as outfile:
+                json.dump(self._hashes, outfile)
+        os.replace(f"{self.filename}.tmp", self.filename)
+
+
+def validate(client, validator_url, content):
+    """Sends a page to the validator and returns its error messages
+
+    """
+    response = client.post(validator_url,
+                           data=content,
+                           params={"out": "json"},
+                           headers={"Content-Type": "text/html; charset=utf-8"})
+    response.raise_for_status()
+    return [message["message"]
+            for message in response.json().get("messages", [])
+            if message.get("type") == "error"]
+
+
+def validate_page(client, validator_url, cache, path, all_errors=False):
+    """Validates a page unless it is known to be clean
+
+    Returns the sorted, deduplicated errors of the page or None when it was
+    skipped.
+
+    """
+    with open(path, "rb") as infile:
+        content = infile.read()
+    content_hash = hashlib.sha256(content).hexdigest()
+
+    error_filter = "all errors" if all_errors else ERROR_FILTER
+    cache_key = f"{validator_url} {error_filter} {os.path.abspath(path)}"
+    if cache.is_clean(cache_key, content_hash):
+        return None
+
+    errors = validate(client, validator_url, content)
+    if not all_errors:
+        errors = [error for error in errors if ERROR_FILTER in error]
+    errors = sorted(set(errors))
+
+    cache.set(cache_key, content_hash, clean=not errors)
+    return errors
+
+
+def iter_pages(books_path):
+    for entry in sorted(os.scandir(books_path), key=lambda e: e.name):
+        if entry.is_dir():
+            for page_path in iter_book_pages(entry.path):
+                yield entry.name, page_path
+
+
+# Worded like the validator's messages for the same problems
+PROBLEM_MESSAGES = {
+    "self-closed": "Self-closing syntax (“/>”) used on a non-void HTML element “{}”.",
+    "unclosed": "Unclosed element “{}”.",
+    "stray end tag": "Stray end tag “{}”.",
+}
+
+
+def format_problem(problem):
+    kind, tag, _ = problem
+    return PROBLEM_MESSAGES[kind].format(tag)
+
+
+def precheck_pages(pages, counts):
+    """Runs check_page on every page across all cores
+
+    Yields (book, path, problems) for the pages with problems and counts the
+    clean ones in `counts["prechecked"]`.
+
+    """
+    pages = iter(pages)
+    with ProcessPoolExecutor() as executor:
+        while True:
+            batch = [page for _, page in zip(range(256), pages)]
+            if not batch:
+                return
+            paths = [path for _, path in batch]
+            for (book, path), problems in zip(batch, executor.map(check_page, paths,
+                                                                  chunksize=16)):
+                if problems:
+                    yield book, path, problems
+                else:
+                    counts["prechecked"] += 1
+
+
+def cli():
+    arguments = docopt(__doc__)
+    books_path = arguments["<books_path>"] or os.environ.get("BOOKS_PATH",
+                                                              "./build/books")
+    validator_url = arguments["--validator"]
+    workers = int(arguments["--workers"])
+    all_errors = arguments["--all-errors"]
+    output_filename = os.path.join(OUTPUT_DIR, arguments["--output"])
+
+    client = configure_client(per_host_limit=workers, pool_maxsize=workers)
+    cache = CleanPageCache(CACHE_FILE, enabled=not arguments["--no-cache"])
+
+    counts = {"prechecked": 0}
+    pages = ((book, path, None) for book, path in iter_pages(books_path))
+    if arguments["--precheck"] or arguments["--precheck-only"]:
+        pages = precheck_pages(iter_pages(books_path), counts)
+
+    def check(item):
+        book, path, problems = item
+        if arguments["--precheck-only"]:
+            return book, path, sorted(set(map(format_problem, problems)))
+        return book, path, validate_page(client, validator_url, cache, path,
+                                         all_errors)
+
+    results = {}
+    checked = skipped = 0
+
+    with CsvResultWriter(output_filename, RESULT_FIELDNAMES, datestamp=False,
+                         resume=False) as writer, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        for book, path, errors in executor.map(check, pages):
+            checked += 1
+            if errors is None:
+                skipped += 1
+            elif errors:
+                page = os.path.basename(path)
+                print(f"{book} / {page}: {len(errors)} error(s)")
+                results.setdefault(book, {})[page] = errors
+                writer.write_rows([{"book": book,
+                                    "page": page,
+                                    "error_count": len(errors),
+                                    "errors": "\n".join(errors)}])
+
+            if checked % 500 == 0:
+                cache.save()
+
+    cache.save()
+
+    with open(f"{output_filename}.json", "w") as outfile:
+        json.dump(results, outfile, indent=2)
+
+    print(f"{checked + counts['prechecked']} pages checked "
+          f"({counts['prechecked']} passed the precheck, "
+          f"{skipped} unchanged and clean), {writer.rows_written} with errors")
+    client.stats.print_summary()
+
+
+if __name__ == "__main__":
+    cli()